@@ -1,51 +1,253 @@
 #! /usr/bin/python3
 from email import policy
-import random,argparse,sys,subprocess,os
+import random,argparse,sys,subprocess,os,tempfile,threading,time,json,resource,csv,itertools,hashlib,re,shutil,runpy,io,contextlib,importlib.util
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 parser = argparse.ArgumentParser()
-import numpy as np
+import decoder, decoder_server, mdp_arrays, generate_corpus
 random.seed(0)
 
 
 input_file_ls = ['data/mdp/continuing-mdp-10-5.txt','data/mdp/continuing-mdp-2-2.txt', 'data/mdp/continuing-mdp-25-10.txt', 'data/mdp/continuing-mdp-50-20.txt','data/mdp/episodic-mdp-10-5.txt','data/mdp/episodic-mdp-2-2.txt', 'data/mdp/episodic-mdp-25-10.txt', 'data/mdp/episodic-mdp-50-20.txt']
 flag_ok = 0
+binary_dir = None
+workers = None
+timeout = None
+# label -> {"wall", "cpu", "peak_rss_mb", "returncode"} of every planner,
+# encoder and decoder run, for --report and --baseline
+timings = {}
+timings_lock = threading.Lock()
+# With --cache, the stdout and timing of every successful command are kept
+# under result_cache_dir, keyed by the hashes of the script (and the local
+# modules it imports), of every input file and of the other arguments
+result_cache_dir = None
+
+
+def to_binary(in_file):
+    # Binary copies of the text MDPs, converted once per autograder run
+    global binary_dir
+    if binary_dir is None:
+        binary_dir = tempfile.mkdtemp(prefix="autograder-mdp-")
+    out_file = os.path.join(binary_dir, os.path.basename(in_file).replace(".txt", ".mdpb"))
+    if not os.path.exists(out_file):
+        mdp_arrays.save_binary(mdp_arrays.read_text(in_file), out_file)
+    return out_file
+
+
+def rss_mb(maxrss):
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 2**10
+
+def record(label, wall, cpu, peak_rss_mb, returncode=0):
+    with timings_lock:
+        timings[label] = {"wall": wall, "cpu": cpu, "peak_rss_mb": peak_rss_mb, "returncode": returncode}
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path,'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def source_digest(script):
+    # Hash of script and, transitively, the modules next to it that it imports
+    here = os.path.dirname(os.path.abspath(script))
+    seen, todo, digest = set(), [os.path.abspath(script)], hashlib.sha256()
+    while todo:
+        path = todo.pop()
+        if path in seen or not os.path.exists(path):
+            continue
+        seen.add(path)
+        with open(path,'rb') as f:
+            text = f.read()
+        digest.update(path.encode()+b"\0"+hashlib.sha256(text).digest())
+        for line in re.findall(rb"^\s*(?:import|from)\s+([\w., ]+)", text, re.M):
+            for name in re.split(rb"[,\s]+", line.split(b" import")[0]):
+                if name and name != b"import":
+                    todo.append(os.path.join(here, name.split(b".")[0].decode()+".py"))
+    return digest.hexdigest()
+
+def cache_key(cmd):
+    # Files are hashed by content, so the same input under another temp path hits
+    parts = []
+    for arg in cmd:
+        if arg.endswith(".py") and os.path.exists(arg):
+            parts.append("script:"+os.path.basename(arg)+":"+source_digest(arg))
+        elif os.path.isfile(arg):
+            parts.append("file:"+file_digest(arg))
+        else:
+            parts.append("arg:"+arg)
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:32]
+
+def cache_lookup(key):
+    path = os.path.join(result_cache_dir, key)
+    try:
+        with open(os.path.join(path,"meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(path,"stdout"),'r') as f:
+            return f.read(), meta
+    except (OSError, ValueError):
+        return None
+
+def cache_store(key, cmd, output, entry):
+    os.makedirs(result_cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=result_cache_dir)
+    with open(os.path.join(tmp,"stdout"),'w') as f:
+        f.write(output)
+    with open(os.path.join(tmp,"meta.json"),'w') as f:
+        json.dump(dict(entry, cmd=list(cmd)), f)
+    try:
+        os.rename(tmp, os.path.join(result_cache_dir, key))
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def invalidate(cache_dir, script=None):
+    # Drop every cached result, or only those of one script; returns the count
+    if not os.path.isdir(cache_dir):
+        return 0
+    dropped = 0
+    for key in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, key)
+        if script is not None:
+            try:
+                with open(os.path.join(path,"meta.json")) as f:
+                    cmd = json.load(f)["cmd"]
+            except (OSError, ValueError, KeyError):
+                cmd = []
+            if not any(os.path.basename(arg) == os.path.basename(script) for arg in cmd):
+                continue
+        shutil.rmtree(path, ignore_errors=True)
+        dropped += 1
+    return dropped
+
+def run_command(cmd, stdout_path=None, log=print, label=None):
+    # run_uncached, answered from the result cache when --cache is on
+    if result_cache_dir is None:
+        return run_uncached(cmd, stdout_path, log, label)
+    key = cache_key(cmd)
+    hit = cache_lookup(key)
+    if hit is not None:
+        output, meta = hit
+        record(label or " ".join(cmd), meta["wall"], meta["cpu"], meta["peak_rss_mb"], meta["returncode"])
+        with timings_lock:
+            timings[label or " ".join(cmd)]["cached"] = True
+        if stdout_path:
+            with open(stdout_path,'w') as f:
+                f.write(output)
+            return ""
+        return output
+    output = run_uncached(cmd, stdout_path, log, label)
+    entry = timings[label or " ".join(cmd)]
+    if entry["returncode"] == 0:
+        if stdout_path:
+            with open(stdout_path) as f:
+                cache_store(key, cmd, f.read(), entry)
+        else:
+            cache_store(key, cmd, output, entry)
+    return output
+
+def run_uncached(cmd, stdout_path=None, log=print, label=None):
+    # stdout of cmd as text ("" if it failed), killed after the per-case
+    # timeout; a nonzero exit is logged as a mistake with the end of its
+    # stderr. wait4 gives this child's own CPU time and peak RSS for the report
+    # (on Linux a child's peak RSS is never below the autograder's RSS when
+    # it was spawned, about 60 MB with numpy and scipy imported)
+    out = open(stdout_path,'w') if stdout_path else subprocess.PIPE
+    err = tempfile.TemporaryFile('w+')
+    start = time.perf_counter()
+    p = subprocess.Popen(cmd,stdout=out,stderr=err,text=True)
+    killed = []
+    timer = threading.Timer(timeout,lambda: killed.append(p.kill())) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        output = p.stdout.read() if stdout_path is None else ""
+        _, status, usage = os.wait4(p.pid,0)
+    finally:
+        if timer:
+            timer.cancel()
+        if stdout_path:
+            out.close()
+        else:
+            p.stdout.close()
+    p.returncode = os.waitstatus_to_exitcode(status)
+    record(label or " ".join(cmd), time.perf_counter()-start, usage.ru_utime+usage.ru_stime, rss_mb(usage.ru_maxrss), p.returncode)
+    err.seek(0)
+    stderr = err.read()
+    err.close()
+    if killed:
+        log("\n","*"*10,"Mistake: timed out after",timeout,"seconds:"," ".join(cmd),"*"*10)
+        return ""
+    if p.returncode != 0:
+        log("\n","*"*10,"Mistake: exited with code",p.returncode,":"," ".join(cmd),"*"*10)
+        for line in stderr.splitlines()[-10:]:
+            log("\t"+line)
+        return ""
+    return output
+
+def succeeded(label):
+    with timings_lock:
+        return timings[label]["returncode"] == 0
+
+def compare_timings(baseline, max_slowdown, min_seconds=0.05):
+    # (label, baseline wall, wall) of the runs more than max_slowdown percent
+    # slower than the baseline; differences under min_seconds are noise
+    slower = []
+    for label, entry in sorted(timings.items()):
+        old = baseline.get(label)
+        if old and entry["wall"] > old["wall"]*(1+max_slowdown/100) and entry["wall"]-old["wall"] > min_seconds:
+            slower.append((label, old["wall"], entry["wall"]))
+    return slower
+
+def run_cases(fn, cases):
+    # Each case runs its own processes, so a thread per case keeps every core
+    # busy; map hands the results back in case order
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(lambda case: fn(*case), cases))
 
 
 class VerifyOutputPlanner:
-    def __init__(self,algorithm,print_error):
+    def __init__(self,algorithm,print_error,binary=False):
         algorithm_ls = list()
         if algorithm=='all':
             algorithm_ls+=['hpi','lp', 'default']
         else:
             algorithm_ls.append(algorithm)
             
+        # (header, planner command, mdp file, policy evaluation?) for every case
+        cases = []
         for algo in algorithm_ls:
-            print('verify output',algo)
             counter = 1    
         
             for in_file in input_file_ls:
-                print("\n\n","-"*100)
+                mdp_file = to_binary(in_file) if binary else in_file
                 if algo == 'default':
-                    cmd_planner = "python3","planner.py","--mdp",in_file
+                    cmd_planner = "python3","planner.py","--mdp",mdp_file
                 else:
-                    cmd_planner = "python3","planner.py","--mdp",in_file,"--algorithm",algo
-                print('test case',str(counter),algo,":\t"," ".join(cmd_planner))
+                    cmd_planner = "python3","planner.py","--mdp",mdp_file,"--algorithm",algo
+                header = ['test case',str(counter),algo,":\t"," ".join(cmd_planner)]
+                if counter == 1:
+                    header = ['verify output',algo,'\n']+header
+                cases.append((header,cmd_planner,in_file,False,"planner %s %s" % (algo,in_file)))
                 counter+=1
-                cmd_output = subprocess.check_output(cmd_planner,universal_newlines=True)
-                self.verifyOutput(cmd_output,in_file,print_error)
         policy_eval_files = ['data/mdp/continuing-mdp-10-5.txt', 'data/mdp/episodic-mdp-10-5.txt']
         for in_file in policy_eval_files:
-            cmd_planner = "python3","planner.py","--mdp",in_file, "--policy", in_file.replace("continuing","policy-continuing").replace("episodic","policy-episodic")
-            print('test case',str(counter),'policy evaluation',":\t"," ".join(cmd_planner))
+            cmd_planner = "python3","planner.py","--mdp",to_binary(in_file) if binary else in_file, "--policy", in_file.replace("continuing","policy-continuing").replace("episodic","policy-episodic")
+            cases.append((['test case',str(counter),'policy evaluation',":\t"," ".join(cmd_planner)],cmd_planner,in_file,True,"planner policy-eval %s" % in_file))
             counter+=1
-            cmd_output = subprocess.check_output(cmd_planner,universal_newlines=True)
-            self.verifyOutput(cmd_output,in_file,print_error, pol_eval = True)
+
+        outputs = run_cases(lambda header,cmd_planner,in_file,pol_eval,label: run_command(cmd_planner,label=label), cases)
+        for (header,cmd_planner,in_file,pol_eval,label),cmd_output in zip(cases,outputs):
+            if not pol_eval:
+                print("\n\n","-"*100)
+            print(*header)
+            self.verifyOutput(cmd_output,in_file,print_error, pol_eval = pol_eval)
         
     def verifyOutput(self,cmd_output,in_file,pe, pol_eval = False):
 
         sol_file = in_file.replace("continuing","sol-continuing").replace("episodic","sol-episodic")
         if (pol_eval):
             sol_file = in_file.replace("continuing","sol-policy-continuing").replace("episodic","sol-policy-episodic")
-        base = np.loadtxt(sol_file,delimiter=" ",dtype=float)
+        base = mdp_arrays.read_columns(sol_file,2)
         output = cmd_output.split("\n")
         nstates = base.shape[0]
         
@@ -87,28 +289,195 @@ class VerifyOutputPlanner:
                     flag_ok = 1
                     print("\tNot OK")
 
-def run(gameconfig, test):
-    cmd_encoder = "python3", "encoder.py", "--game_config", gameconfig
-    print("\n","Generating the MDP encoding using encoder.py")
-    f = open('verify_attt_mdp','w')
-    subprocess.call(cmd_encoder,stdout=f)
-    f.close()
-
-    cmd_planner = "python3","planner.py","--mdp","verify_attt_mdp"
-    print("\n","Generating the value policy file using planner.py using default algorithm")
-    f = open('verify_attt_planner','w')
-    subprocess.call(cmd_planner,stdout=f)
-    f.close()
-
-    cmd_decoder = "python3","decoder.py","--testcase",test
-    print("\n","Generating the decoded policy file using decoder.py")
-    
-    cmd_output = subprocess.check_output(cmd_decoder,universal_newlines=True)
-        
-    os.remove('verify_attt_mdp')
-    os.remove('verify_attt_planner')
+def run(gameconfig, test, client=None, binary=False, log=print):
+    # The encoder and planner files live in a private temp directory, so
+    # several game configs can run at once
+    with tempfile.TemporaryDirectory(prefix="autograder-") as tmp:
+        mdp_file = os.path.join(tmp, 'verify_attt_mdp')
+        planner_file = os.path.join(tmp, 'verify_attt_planner')
+        cmd_encoder = "python3", "encoder.py", "--game_config", gameconfig
+        log("\n","Generating the MDP encoding using encoder.py")
+        run_command(cmd_encoder, mdp_file, log, "encoder %s" % gameconfig)
+        if not succeeded("encoder %s" % gameconfig):
+            return ""
+        if binary:
+            log("\n","Converting the MDP encoding to the binary format")
+            try:
+                mdp = mdp_arrays.read_text(mdp_file)
+            except ValueError as e:
+                log("\n","*"*10,"Mistake: encoder.py output is not an MDP:",e,"*"*10)
+                return ""
+            mdp_file = os.path.join(tmp, 'verify_attt_mdp.mdpb')
+            mdp_arrays.save_binary(mdp, mdp_file)
+
+        cmd_planner = "python3","planner.py","--mdp",mdp_file
+        log("\n","Generating the value policy file using planner.py using default algorithm")
+        run_command(cmd_planner, planner_file, log, "planner default %s" % gameconfig)
+        if not succeeded("planner default %s" % gameconfig):
+            return ""
+
+        if client is None:
+            cmd_decoder = "python3","decoder.py","--testcase",test,"--value_policy",planner_file
+            log("\n","Generating the decoded policy file using decoder.py")
+            cmd_output = run_command(cmd_decoder, log=log, label="decoder %s" % gameconfig)
+        else:
+            log("\n","Decoding the test hands with the decoder server")
+            start = time.perf_counter()
+            threshold, bonus, sequence = decoder.parse_game_config(test)
+            actions = client.query(threshold, bonus, sequence, decoder.parse_testcase(test))
+            record("decoder-server %s" % gameconfig, time.perf_counter()-start, None, None)
+            cmd_output = "".join(str(a) + "\n" for a in actions)
     return cmd_output
 
+# planner.py run by import swaps sys.argv and sys.stdout, which every
+# thread shares, so only one in-process planner runs at a time
+planner_lock = threading.Lock()
+
+def run_planner_in_process(mdp_file, planner_file, label):
+    # planner.py's main run by runpy, as "python3 planner.py --mdp mdp_file" would
+    output = io.StringIO()
+    with planner_lock:
+        argv = sys.argv
+        sys.argv = ["planner.py", "--mdp", mdp_file]
+        start, cpu = time.perf_counter(), time.thread_time()
+        try:
+            with contextlib.redirect_stdout(output):
+                runpy.run_path("planner.py", run_name="__main__")
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise RuntimeError("planner.py exited with %s" % e.code)
+        finally:
+            sys.argv = argv
+        record(label, time.perf_counter()-start, time.thread_time()-cpu,
+               rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+    with open(planner_file,'w') as f:
+        f.write(output.getvalue())
+
+def run_in_process(gameconfig, test, client=None, binary=False, log=print):
+    # run() with the encoder and planner called in this process: the MDP
+    # comes from decoder.encode_mdp (what encoder.py prints), planner.py is
+    # run by import when it imports (by subprocess otherwise), and its
+    # values are decoded as decoder.py --testcase --value_policy does. Falls
+    # back to run() only if planner.py cannot be imported; any other error
+    # is a mistake of the case.
+    try:
+        threshold, bonus, sequence = decoder.parse_game_config(gameconfig)
+        with tempfile.TemporaryDirectory(prefix="autograder-") as tmp:
+            mdp_file = os.path.join(tmp, 'verify_attt_mdp')
+            planner_file = os.path.join(tmp, 'verify_attt_planner')
+            log("\n","Generating the MDP encoding in process")
+            start, cpu = time.perf_counter(), time.thread_time()
+            mdp = decoder.encode_mdp(threshold, bonus, sequence)
+            if binary:
+                mdp_arrays.save_binary(mdp, mdp_file)
+            else:
+                with open(mdp_file,'w') as f:
+                    mdp.write_text(f)
+            # Peak RSS is the autograder's own, shared by every in-process case
+            record("encoder-in-process %s" % gameconfig, time.perf_counter()-start, time.thread_time()-cpu,
+                   rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+            if importlib.util.find_spec("planner") is not None:
+                log("\n","Generating the value policy file with planner.py in process")
+                run_planner_in_process(mdp_file, planner_file, "planner-in-process %s" % gameconfig)
+            else:
+                log("\n","Generating the value policy file using planner.py using default algorithm")
+                run_command(("python3","planner.py","--mdp",mdp_file), planner_file, log, "planner default %s" % gameconfig)
+                if not succeeded("planner default %s" % gameconfig):
+                    return ""
+            solution = decoder.planner_solution(planner_file, threshold, bonus, sequence)
+
+        if client is not None:
+            log("\n","Decoding the test hands with the decoder server")
+            start = time.perf_counter()
+            actions = client.query(threshold, bonus, sequence, decoder.parse_testcase(test))
+            record("decoder-server %s" % gameconfig, time.perf_counter()-start, None, None)
+            return "".join(str(a) + "\n" for a in actions)
+        log("\n","Decoding the test hands in process")
+        start, cpu = time.perf_counter(), time.thread_time()
+        actions = decoder.decode_hands(decoder.parse_testcase(test), threshold, solution)
+        record("decoder-in-process %s" % gameconfig, time.perf_counter()-start, time.thread_time()-cpu,
+               rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+        return "".join(str(a) + "\n" for a in actions.tolist())
+    except ImportError as e:
+        log("\n","planner.py does not import in process (%s: %s), falling back to subprocesses" % (type(e).__name__, e))
+        return run(gameconfig, test, client, binary, log)
+    except Exception as e:
+        log("\n","*"*10,"Mistake: in-process run failed:","%s: %s" % (type(e).__name__, e),"*"*10)
+        return ""
+
+def run_logged(gameconfig, test, client=None, binary=False, in_process=False):
+    # run() for a worker thread: its messages are kept and printed in case order
+    lines = []
+    output = (run_in_process if in_process else run)(gameconfig, test, client, binary, lambda *args: lines.append(args))
+    return lines, output
+
+def scaling_benchmark(sizes, actions, gammas, mdptypes, algorithms, csv_file, plot_file=None, binary=False):
+    # Times every planner algorithm on generated MDPs of growing size, one
+    # run at a time so the timings do not disturb each other. Once an
+    # algorithm times out or fails at some size it is skipped for the
+    # larger sizes of that (mdptype, A, gamma) curve. The MDPs are generated
+    # in a worker process so the autograder, and with it the RSS floor of
+    # the planner runs, stays small.
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="autograder-scaling-") as tmp, ProcessPoolExecutor(1) as generator:
+        for mdptype, A, gamma in itertools.product(mdptypes, actions, gammas):
+            live = list(algorithms)
+            for S in sorted(sizes):
+                if not live:
+                    break
+                instance = {"S": S, "A": A, "gamma": gamma, "mdptype": mdptype, "seed": 0,
+                            "large": S > 100 or A > 100, "binary": binary}
+                name, entry = generator.submit(generate_corpus.generate, tmp, instance).result()
+                mdp_file = os.path.join(tmp, name)
+                for algo in list(live):
+                    cmd_planner = ["python3","planner.py","--mdp",mdp_file]
+                    if algo != 'default':
+                        cmd_planner += ["--algorithm",algo]
+                    label = "scaling %s %s S=%d A=%d gamma=%g" % (algo,mdptype,S,A,gamma)
+                    run_command(cmd_planner, label=label, log=lambda *args: None)
+                    t = timings[label]
+                    status = "ok" if t["returncode"] == 0 else ("timeout" if timeout and t["wall"] >= timeout else "failed")
+                    if status != "ok":
+                        live.remove(algo)
+                    rows.append({"algorithm": algo, "mdptype": mdptype, "S": S, "A": A, "gamma": gamma,
+                                 "mdp_bytes": entry["bytes"], "wall": t["wall"], "cpu": t["cpu"],
+                                 "peak_rss_mb": t["peak_rss_mb"], "status": status})
+                    print("%-8s %-10s S=%-7d A=%-4d gamma=%-5g %8.3f s %8.1f MB  %s" % (algo,mdptype,S,A,gamma,t["wall"],t["peak_rss_mb"],status))
+                os.remove(mdp_file)
+    with open(csv_file,'w',newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["algorithm"])
+        writer.writeheader()
+        writer.writerows(rows)
+    if plot_file and rows:
+        plot_scaling(rows, plot_file)
+    return rows
+
+def plot_scaling(rows, plot_file):
+    try:
+        import matplotlib
+    except ImportError:
+        print("matplotlib is not installed, skipping", plot_file)
+        return
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    mdptypes = sorted(set(r["mdptype"] for r in rows))
+    fig, axes = plt.subplots(1, len(mdptypes), figsize=(6*len(mdptypes), 4.5), squeeze=False)
+    for ax, mdptype in zip(axes[0], mdptypes):
+        curves = sorted(set((r["algorithm"],r["A"],r["gamma"]) for r in rows if r["mdptype"] == mdptype))
+        for algo, A, gamma in curves:
+            points = [r for r in rows if (r["mdptype"],r["algorithm"],r["A"],r["gamma"]) == (mdptype,algo,A,gamma) and r["status"] == "ok"]
+            if points:
+                ax.plot([r["S"] for r in points], [r["wall"] for r in points], marker="o", label="%s A=%d gamma=%g" % (algo,A,gamma))
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.set_xlabel("number of states")
+        ax.set_ylabel("planner wall time (s)")
+        ax.set_title(mdptype)
+        ax.legend(fontsize="small")
+    fig.tight_layout()
+    fig.savefig(plot_file)
+
 def verifyOutput(output, solution):
     outputs = [int(i) for i in output.split()]
     solutions = []
@@ -141,12 +510,46 @@ def verifyOutput(output, solution):
 
 if __name__ == "__main__":
     parser.add_argument('--task', type = int, default=None)
-    parser.add_argument("--algorithm",type=str,default="default")
+    parser.add_argument("--algorithm",type=str,default=None,help="Planner algorithm, or all (default: default for Tasks 1 and 2, all for Task 3)")
     parser.add_argument("--pe",type=str,default="yes")
+    parser.add_argument("--decoder_server",type=str,default=None,help="Unix socket of a decoder_server.py to decode with (started if needed)")
+    parser.add_argument("--binary",action="store_true",help="Give the planner MDPs in the binary format")
+    parser.add_argument("--workers",type=int,default=None,help="Cases run at once (default: all cores)")
+    parser.add_argument("--timeout",type=float,default=None,help="Per-case timeout in seconds")
+    parser.add_argument("--in_process",action="store_true",help="Decode Task 2 cases in this interpreter instead of subprocesses")
+    parser.add_argument("--report",type=str,default=None,help="Write wall/CPU time and peak RSS of every run to this JSON file")
+    parser.add_argument("--baseline",type=str,default=None,help="JSON report to compare the wall times against")
+    parser.add_argument("--max_slowdown",type=float,default=50.0,help="Allowed slowdown over the baseline in percent")
+    parser.add_argument("--cache",action="store_true",help="Answer unchanged (script, input, arguments) runs from the result cache")
+    parser.add_argument("--cache_dir",type=str,default=".autograder_cache",help="Directory of the result cache")
+    parser.add_argument("--clear_cache",action="store_true",help="Empty the result cache and exit")
+    parser.add_argument("--invalidate",type=str,default=None,help="Drop the cached results of this script (e.g. planner.py) and exit")
+    parser.add_argument("--sizes",type=int,nargs="+",default=[10,100,1000,10000,100000],help="Task 3: numbers of states")
+    parser.add_argument("--actions",type=int,nargs="+",default=[2,10,100],help="Task 3: numbers of actions")
+    parser.add_argument("--gammas",type=float,nargs="+",default=[0.9,0.99],help="Task 3: discount factors")
+    parser.add_argument("--scaling_csv",type=str,default="planner_scaling.csv",help="Task 3: CSV of the timings")
+    parser.add_argument("--scaling_plot",type=str,default="planner_scaling.png",help="Task 3: plot of the timings")
     args = parser.parse_args()
+    workers = args.workers
+    timeout = args.timeout
+    if args.clear_cache or args.invalidate:
+        print("Dropped", invalidate(args.cache_dir, args.invalidate), "cached results")
+        sys.exit(0)
+    if args.cache:
+        result_cache_dir = args.cache_dir
+    client = decoder_server.connect(args.decoder_server) if args.decoder_server else None
+
+    if(args.task == 3):
+        print("Planner scaling benchmark")
+        if timeout is None:
+            timeout = 60.0
+        algorithms = ['hpi','lp','default'] if args.algorithm in (None,'all') else [args.algorithm]
+        scaling_benchmark(args.sizes, args.actions, args.gammas, ["continuing","episodic"], algorithms,
+                          args.scaling_csv, args.scaling_plot, args.binary)
+        print("Wrote", args.scaling_csv)
 
-    if(args.task == 1):
-        algo = VerifyOutputPlanner(args.algorithm,args.pe)
+    elif(args.task == 1):
+        algo = VerifyOutputPlanner(args.algorithm or 'default',args.pe,args.binary)
         if(flag_ok):
             print("THERE IS A MISTAKE in Task 1")
             
@@ -155,18 +558,18 @@ if __name__ == "__main__":
         in_file_test_ls = ['data/test/test_' + str(i) + '.txt' for i in range(0, 5)]
         in_file_sol_ls = ['data/test/test_' + str(i) + '_solution.txt' for i in range(0, 5)]
 
-        i = 0
-        for in_file, in_file_test, in_file_sol in zip(in_file_ls, in_file_test_ls, in_file_sol_ls):
+        results = run_cases(run_logged, [(in_file, in_file_test, client, args.binary, args.in_process) for in_file, in_file_test in zip(in_file_ls, in_file_test_ls)])
+        for in_file, (lines, output), in_file_sol in zip(in_file_ls, results, in_file_sol_ls):
             print("Running for ", in_file) 
-            output = run(in_file, in_file_test)
+            for line in lines:
+                print(*line)
             verifyOutput(output, in_file_sol)
-            i +=1
     else:
         print("Running both tasks")
         print("\n\n","-"*100)
         print("TASK 1")
         print("\n\n","-"*100)
-        algo = VerifyOutputPlanner(args.algorithm,args.pe)
+        algo = VerifyOutputPlanner(args.algorithm or 'default',args.pe,args.binary)
         if(flag_ok):
             print("THERE IS A MISTAKE in Task 1")
         print("\n\n","-"*100)
@@ -178,15 +581,26 @@ if __name__ == "__main__":
         in_file_test_ls = ['data/test/test_' + str(i) + '.txt' for i in range(0, 5)]
         in_file_sol_ls = ['data/test/test_' + str(i) + '_solution.txt' for i in range(0, 5)]
 
-        i = 0
-        for in_file, in_file_test, in_file_sol in zip(in_file_ls, in_file_test_ls, in_file_sol_ls):
+        results = run_cases(run_logged, [(in_file, in_file_test, client, args.binary, args.in_process) for in_file, in_file_test in zip(in_file_ls, in_file_test_ls)])
+        for in_file, (lines, output), in_file_sol in zip(in_file_ls, results, in_file_sol_ls):
             print("Running for ", in_file) 
-            output = run(in_file, in_file_test)
+            for line in lines:
+                print(*line)
             verifyOutput(output, in_file_sol)
-            i +=1
         print("\n\n","-"*100)
         print("TASK 2 COMPLETED")  
         print("\n\n","-"*100)
 
         
 
+    if args.report:
+        with open(args.report,'w') as f:
+            json.dump(dict(sorted(timings.items())),f,indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare_timings(json.load(f),args.max_slowdown)
+        for label,old,new in slower:
+            print("Mistake: %s took %.3f s, baseline %.3f s (+%.0f%%)" % (label,new,old,100*(new/old-1)))
+        if slower:
+            print("THERE IS A PERFORMANCE REGRESSION")
+            sys.exit(1)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import decoder
+import policy_cache
+
+# The transitions of the largest threshold are built once in the parent and
+# placed in shared memory; every worker maps the same blocks and restricts
+# them to each configuration it is handed, so nothing large is pickled.
+SHARED_ARRAYS = ["states", "counts", "base_index", "reward", "row_state", "row_action", "indptr", "succ", "prob", "bust"]
+
+_base = None
+_blocks = []
+
+
+def share(trans):
+    """Copy the arrays of trans into shared memory; returns (blocks, spec) for init_worker."""
+    blocks, arrays = [], {}
+    for name in SHARED_ARRAYS:
+        arr = np.ascontiguousarray(getattr(trans, name))
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+        blocks.append(shm)
+        arrays[name] = (shm.name, arr.shape, arr.dtype.str)
+    scalars = {k: v for k, v in trans.__dict__.items() if k not in SHARED_ARRAYS}
+    return blocks, (type(trans), scalars, arrays)
+
+def attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching also registers the block, but pool
+        # workers share the parent's resource tracker, so that is harmless.
+        return shared_memory.SharedMemory(name=name)
+
+def init_worker(spec):
+    global _base
+    cls, scalars, arrays = spec
+    _base = object.__new__(cls)
+    _base.__dict__.update(scalars)
+    for name, (shm_name, shape, dtype) in arrays.items():
+        shm = attach(shm_name)
+        _blocks.append(shm)
+        setattr(_base, name, np.ndarray(shape, np.dtype(dtype), buffer=shm.buf))
+
+def solve_one(config, solver):
+    start = time.perf_counter()
+    threshold, bonus, sequence = config
+    trans = _base.restrict(threshold, bonus, sequence)
+    stats = {}
+    V, policy = decoder.SOLVERS[solver](trans, stats=stats)
+    stats.update(states=trans.n, seconds=time.perf_counter() - start)
+    return config, trans.solution(V, policy), stats
+
+def solve_many(configs, symmetric=False, solver="vi", workers=None):
+    """Solve (threshold, bonus, sequence) configurations on a process pool.
+
+    Yields (config, solution, stats) as each solve finishes, in completion
+    order; solution is the dict of arrays that decoder.decode_hands takes.
+    """
+    configs = [(threshold, bonus, list(sequence)) for threshold, bonus, sequence in configs]
+    if not configs:
+        return
+    top = max(threshold for threshold, _, _ in configs)
+    base = decoder.SymmetricTransitions(top, 0, []) if symmetric else decoder.Transitions(top, 0, [])
+    blocks, spec = share(base)
+    del base
+    try:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(spec,)) as pool:
+            futures = [pool.submit(solve_one, config, solver) for config in configs]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+def grid(thresholds, bonuses, sequences):
+    return [(t, b, list(seq)) for t, b, seq in itertools.product(thresholds, bonuses, sequences)]
+
+def parse_range(text):
+    """"10:30" -> 10..29, "10:30:5" -> 10, 15, ..., "18" -> [18]."""
+    parts = list(map(int, text.split(":")))
+    return list(range(*parts)) if len(parts) > 1 else parts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve many card-game configurations in parallel.")
+    parser.add_argument("--configs", nargs="*", default=[], help="Game config files (globs allowed)")
+    parser.add_argument("--thresholds", default=None, help="Threshold range for a grid, e.g. 10:30 or 10:30:2")
+    parser.add_argument("--bonus", type=int, nargs="+", default=[0], help="Bonuses for the grid")
+    parser.add_argument("--sequence", nargs="+", default=["1 2 3"], help="Quoted sequences for the grid, e.g. \"4 5 6\"")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--symmetric", action="store_true", help="Solve over suit-symmetric value counts")
+    parser.add_argument("--solver", choices=sorted(decoder.SOLVERS), default="vi")
+    parser.add_argument("--cache_dir", default=None, help="Store every solution in this policy cache")
+    args = parser.parse_args()
+
+    configs = [decoder.parse_game_config(path) for pattern in args.configs for path in sorted(glob.glob(pattern))]
+    if args.thresholds:
+        configs += grid(parse_range(args.thresholds), args.bonus, [list(map(int, s.split())) for s in args.sequence])
+    if not configs:
+        parser.error("give --configs and/or --thresholds")
+
+    name = args.solver + "-sym" if args.symmetric else args.solver
+    for (threshold, bonus, sequence), solution, stats in solve_many(configs, args.symmetric, args.solver, args.workers):
+        if args.cache_dir:
+            key = policy_cache.cache_key(threshold, bonus, sequence, name, decoder.CACHE_VERSION)
+            policy_cache.store(args.cache_dir, key, solution)
+        print(json.dumps({"threshold": threshold, "bonus": bonus, "sequence": sequence,
+                          "value": float(solution["value"][0]) if len(solution["value"]) else 0.0, **stats}), flush=True)
+
+if __name__ == "__main__":
+    main()
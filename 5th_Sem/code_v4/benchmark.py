@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import decoder
+from batch_solve import parse_range
+
+# Every point is run in a fresh spawned process so that its peak RSS is its
+# own. A baseline is the JSON this script writes with --save_baseline; a
+# later run with --baseline flags points whose solve got slower than allowed.
+DEFAULT_SEQUENCES = ["1 2 3", "4 5 6"]
+
+
+def point_name(point):
+    threshold, bonus, sequence, symmetric, solver = point
+    name = f"T{threshold}-b{bonus}-{','.join(map(str, sequence))}-{solver}"
+    return name + "-sym" if symmetric else name
+
+def read_solution(path):
+    return [set(line.split()) for line in open(path) if line.strip()]
+
+def run_point(point, cases):
+    threshold, bonus, sequence, symmetric, solver = point
+    start = time.perf_counter()
+    decoder.generate_all_hands(threshold)
+    enumerate_seconds = time.perf_counter() - start
+
+    stats = {}
+    start = time.perf_counter()
+    trans, V, policy = decoder.compute_policy(threshold, bonus, sequence, symmetric, solver, stats)
+    wall = time.perf_counter() - start
+    result = {"name": point_name(point), "states": trans.n, "iterations": stats.get("iterations"),
+              "backups": stats.get("backups"), "generate_all_hands": enumerate_seconds, "wall": wall,
+              "backups_per_second": stats.get("backups_per_second"), "peak_rss_mb": decoder.peak_rss_mb()}
+
+    if cases:
+        solution = trans.solution(V, policy)
+        wrong = 0
+        for hands, expected in cases:
+            actions = decoder.decode_hands(hands, threshold, solution)
+            wrong += len(hands) != len(expected)
+            wrong += sum(str(a) not in ok for a, ok in zip(actions.tolist(), expected))
+        result["correct"] = wrong == 0
+    return result
+
+def testcases(pattern):
+    """(config, [(hands, expected answers)]) for every testcase with a solution file."""
+    found = {}
+    for path in sorted(glob.glob(pattern)):
+        solution = path[:-4] + "_solution.txt"
+        if path.endswith("_solution.txt") or not os.path.exists(solution):
+            continue
+        threshold, bonus, sequence = decoder.parse_game_config(path)
+        found.setdefault((threshold, bonus, tuple(sequence)), []).append((decoder.parse_testcase(path),
+                                                                          read_solution(solution)))
+    return found
+
+def compare(results, baseline, max_slowdown, min_seconds=0.05):
+    """Names of points whose wall time grew more than max_slowdown percent; differences under min_seconds are noise."""
+    slower = []
+    for result in results:
+        old = baseline.get(result["name"])
+        if (old is not None and result["wall"] > old["wall"] * (1 + max_slowdown / 100)
+                and result["wall"] - old["wall"] > min_seconds):
+            slower.append((result["name"], old["wall"], result["wall"]))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the card-game solver over a grid of configurations.")
+    parser.add_argument("--thresholds", default="8:27:6", help="Threshold range, e.g. 10:30 or 8:27:6")
+    parser.add_argument("--bonus", type=int, nargs="+", default=[0, 100])
+    parser.add_argument("--sequence", nargs="+", default=DEFAULT_SEQUENCES, help="Quoted sequences, e.g. \"4 5 6\"")
+    parser.add_argument("--solver", nargs="+", choices=sorted(decoder.SOLVERS), default=["vi"])
+    parser.add_argument("--symmetric", action="store_true", help="Also benchmark the suit-symmetric solver")
+    parser.add_argument("--tests", default="data/test/test_*.txt", help="Testcases checked for correctness")
+    parser.add_argument("--baseline", default=None, help="Baseline JSON to compare wall times against")
+    parser.add_argument("--save_baseline", default=None, help="Write this run's results as a baseline")
+    parser.add_argument("--max_slowdown", type=float, default=10.0, help="Allowed slowdown in percent")
+    args = parser.parse_args()
+
+    cases = testcases(args.tests)
+    configs = [(t, b, tuple(map(int, s.split()))) for t in parse_range(args.thresholds)
+               for b in args.bonus for s in args.sequence]
+    configs += [config for config in cases if config not in configs]
+    points = [(t, b, list(seq), symmetric, solver) for t, b, seq in configs for solver in args.solver
+              for symmetric in ([False, True] if args.symmetric else [False])]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for point in points:
+            threshold, bonus, sequence = point[:3]
+            result = pool.apply(run_point, (point, cases.get((threshold, bonus, tuple(sequence)), [])))
+            results.append(result)
+            print(f"{result['name']:<28} {result['states']:>9} states {result['wall']:8.3f} s "
+                  f"{result['peak_rss_mb'] or 0:8.1f} MB" + {True: "  ok", False: "  WRONG"}.get(result.get("correct"), ""),
+                  flush=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({result["name"]: result for result in results}, f, indent=1)
+
+    failed = [result["name"] for result in results if result.get("correct") is False]
+    for name in failed:
+        print(f"incorrect policy: {name}", file=sys.stderr)
+    slower = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f), args.max_slowdown)
+        for name, old, new in slower:
+            print(f"slowdown: {name} {old:.3f} s -> {new:.3f} s (+{100 * (new / old - 1):.0f}%)", file=sys.stderr)
+    sys.exit(1 if failed or slower else 0)
+
+if __name__ == "__main__":
+    main()
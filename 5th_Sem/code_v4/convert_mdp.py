@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+
+import mdp_arrays
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert MDP files between the text and binary formats.")
+    parser.add_argument("input", help="MDP file, text or binary")
+    parser.add_argument("output", help="Output file, or - for stdout (text only)")
+    parser.add_argument("--to", choices=["binary", "text"], default=None,
+                        help="Output format (default: the opposite of the input)")
+    args = parser.parse_args()
+
+    binary_in = mdp_arrays.is_binary(args.input)
+    to = args.to or ("text" if binary_in else "binary")
+    mdp = mdp_arrays.load(args.input)
+    if to == "binary":
+        if args.output == "-":
+            parser.error("binary output needs a file")
+        mdp_arrays.save_binary(mdp, args.output)
+    elif args.output == "-":
+        mdp.write_text(sys.stdout)
+    else:
+        with open(args.output, "w") as f:
+            mdp.write_text(f)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,66 @@
 #!/usr/bin/env python3
 import argparse
-from collections import deque
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+import warnings
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import mdp_arrays
+import policy_cache
+
+# A hand is a 26-bit integer: bit (a - 1) is the card removed by SWAP action a,
+# i.e. bits 0..12 are 1H..13H and bits 13..25 are 1D..13D.
+NUM_CARDS = 26
+SUITS = ['H', 'D']
+CARD_VALUE = [b % 13 + 1 for b in range(NUM_CARDS)]
+# Bits in the order the solver visits cards: by value, hearts before diamonds.
+CARD_ORDER = [s * 13 + (num - 1) for num in range(1, 14) for s in range(len(SUITS))]
+MAX_HAND_SUM = sum(CARD_VALUE)
+# Bump whenever a change to the solvers can change cached values or policies.
+SOLVER_VERSION = 2
+
+
+def source_hash():
+    """Hash of this file: cache keys include it, so an edited solver never reuses old policies."""
+    with open(os.path.abspath(__file__), "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+# What the policy cache is keyed by besides the game and the solver name
+CACHE_VERSION = f"{SOLVER_VERSION}-{source_hash()}"
+
+
+def card_to_bit(num, suit):
+    if not 1 <= num <= 13 or suit not in SUITS:
+        raise ValueError(f"no such card {num}{suit}")
+    return SUITS.index(suit) * 13 + (num - 1)
+
+def bit_to_card(bit):
+    return (CARD_VALUE[bit], SUITS[bit // 13])
+
+def build_rank_table(threshold):
+    # counts[i][r] = number of subsets of cards i..25 whose sum is at most r.
+    budget = min(threshold - 1, MAX_HAND_SUM)
+    counts = [[0] * (budget + 1) for _ in range(NUM_CARDS + 1)]
+    counts[NUM_CARDS] = [1] * (budget + 1)
+    for i in range(NUM_CARDS - 1, -1, -1):
+        v = CARD_VALUE[i]
+        nxt = counts[i + 1]
+        counts[i] = [nxt[r] + (nxt[r - v] if r >= v else 0) for r in range(budget + 1)]
+    return counts
+
+def num_hands(table):
+    return table[0][-1] if table[0] else 0
 
 def parse_game_config(file_path):
     lines = [line.strip() for line in open(file_path) if line.strip()]
@@ -11,150 +70,810 @@ def parse_game_config(file_path):
     sequence = list(map(int, config_lines[2].split()))
     return threshold, bonus, sequence
 
+def parse_hand(line):
+    """Mask of a space-separated hand such as "1H 5D 4H"."""
+    mask = 0
+    for c in line.split():
+        mask |= 1 << card_to_bit(int(c[:-1]), c[-1])
+    return mask
+
 def parse_testcase(file_path):
-    lines = [line.strip() for line in open(file_path) if line.strip()]
+    # A blank line after "Testcase:" is the empty hand (mask 0); blank lines
+    # at the end of the file are not hands
+    lines = [line.strip() for line in open(file_path)]
+    while lines and not lines[-1]:
+        lines.pop()
     start = False
     hands = []
     for line in lines:
         if line == "Testcase:":
             start = True
             continue
-        if start and line:
-            hand = []
-            for c in line.split():
-                num = int(c[:-1])
-                suit = c[-1]
-                hand.append((num, suit))
-            hands.append(tuple(sorted(hand)))
+        if start:
+            hands.append(parse_hand(line))
     return hands
 
-def generate_all_hands(threshold):
-    cards = [(num, suit) for num in range(1, 14) for suit in ['H', 'D']]
-    hands = set()
-    hands.add(())
-    queue = deque([()])
-    while queue:
-        hand = queue.popleft()
-        hand_sum = sum(card[0] for card in hand)
-        for card in cards:
-            if card not in hand:
-                new_hand = tuple(sorted(hand + (card,)))
-                if hand_sum + card[0] < threshold and new_hand not in hands:
-                    hands.add(new_hand)
-                    queue.append(new_hand)
-    return sorted(list(hands))
-
-def check_special_sequence(hand, sequence):
-    nums = sorted([card[0] for card in hand])
-    for i in range(len(nums) - len(sequence) + 1):
-        if nums[i:i+len(sequence)] == sequence:
-            return True
-    return False
-
-def compute_policy(threshold, bonus, sequence):
-    all_hands = generate_all_hands(threshold)
-    terminal_states = ["BUST", "STOP"]
-    states = all_hands + terminal_states
-    state_to_idx = {s: i for i, s in enumerate(states)}
-    n = len(states)
-    V = [0] * n
-    policy = [27] * n
-    all_cards = [(num, suit) for num in range(1, 14) for suit in ['H', 'D']]
+def rank_hands(masks, table):
+    """Index of each hand (sum below threshold) among all such hands in lexicographic bit order."""
+    counts = np.asarray(table, dtype=np.int64)
+    masks = np.asarray(masks, dtype=np.int64)
+    ranks = np.zeros(masks.shape, dtype=np.int64)
+    budget = np.full(masks.shape, counts.shape[1] - 1, dtype=np.int64)
+    for b in range(NUM_CARDS):
+        has = (masks >> b) & 1 == 1
+        ranks[has] += counts[b + 1, budget[has]]
+        budget[has] -= CARD_VALUE[b]
+    return ranks
+
+def unrank_hands(ranks, table):
+    counts = np.asarray(table, dtype=np.int64)
+    ranks = np.array(ranks, dtype=np.int64)
+    masks = np.zeros(ranks.shape, dtype=np.int64)
+    budget = np.full(ranks.shape, counts.shape[1] - 1, dtype=np.int64)
+    for b in range(NUM_CARDS):
+        skip = counts[b + 1, budget]
+        take = ranks >= skip
+        ranks[take] -= skip[take]
+        masks[take] |= 1 << b
+        budget[take] -= CARD_VALUE[b]
+    return masks
+
+def generate_all_hands(threshold, table=None):
+    if table is None:
+        table = build_rank_table(threshold)
+    return unrank_hands(np.arange(num_hands(table)), table).tolist()
+
+def value_counts(masks, num_suits=2):
+    """Copies of each rank 1..13 held by every hand, shape (len(masks), 13)."""
+    masks = np.asarray(masks, dtype=np.int64)
+    bits = (masks[:, None] >> np.arange(13 * num_suits)) & 1
+    return bits.reshape(len(masks), num_suits, 13).sum(axis=1)
+
+def build_count_table(threshold, num_suits=2):
+    # counts[i][r] = number of value-count vectors over ranks i+1..13, with at
+    # most num_suits copies each, whose value sum is at most r.
+    budget = min(threshold - 1, num_suits * 91)
+    counts = [[0] * (budget + 1) for _ in range(14)]
+    counts[13] = [1] * (budget + 1)
+    for i in range(12, -1, -1):
+        v = i + 1
+        nxt = counts[i + 1]
+        counts[i] = [sum(nxt[r - k * v] for k in range(num_suits + 1) if k * v <= r) for r in range(budget + 1)]
+    return counts
+
+def rank_counts(vectors, table):
+    """Lexicographic index of value-count vectors, the canonical analogue of rank_hands."""
+    counts = np.asarray(table, dtype=np.int64)
+    vectors = np.asarray(vectors, dtype=np.int64).reshape(-1, 13)
+    ranks = np.zeros(len(vectors), dtype=np.int64)
+    budget = np.full(len(vectors), counts.shape[1] - 1, dtype=np.int64)
+    for i in range(13):
+        v = i + 1
+        for k in range(int(vectors[:, i].max(initial=0))):
+            more = vectors[:, i] > k
+            ranks[more] += counts[i + 1, budget[more] - k * v]
+        budget -= vectors[:, i] * v
+    return ranks
+
+def unrank_counts(ranks, table, num_suits=2):
+    counts = np.asarray(table, dtype=np.int64)
+    ranks = np.array(ranks, dtype=np.int64)
+    vectors = np.zeros((len(ranks), 13), dtype=np.int64)
+    budget = np.full(len(ranks), counts.shape[1] - 1, dtype=np.int64)
+    for i in range(13):
+        active = np.ones(len(ranks), dtype=bool)
+        for k in range(num_suits):
+            skip = counts[i + 1, np.maximum(budget, 0)]
+            take = active & (ranks >= skip)
+            ranks[take] -= skip[take]
+            vectors[take, i] += 1
+            budget[take] -= i + 1
+            active = take
+    return vectors
+
+def special_sequence_mask(counts, sequence):
+    """Whether each value-count row contains the special sequence as a run of its sorted values."""
+    counts = np.asarray(counts)
+    n = counts.shape[0]
+    if not sequence:
+        return np.ones(n, dtype=bool)
+    if list(sequence) != sorted(sequence) or sequence[0] < 1 or sequence[-1] > 13:
+        return np.zeros(n, dtype=bool)
+    # A run of the sorted hand equals the sequence iff every rank strictly
+    # inside the sequence appears exactly as often, and the end ranks at least.
+    need = np.bincount(sequence, minlength=14)[1:]
+    lo, hi = sequence[0] - 1, sequence[-1] - 1
+    ok = (counts[:, lo] >= need[lo]) & (counts[:, hi] >= need[hi])
+    for v in range(lo + 1, hi):
+        ok &= counts[:, v] == need[v]
+    return ok
+
+def row_entries(indptr, rows):
+    """Concatenated CSR entry indices of the given rows."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
+
+def successor_rows(states, sums, threshold, table, n):
+    """CSR rows (row_state, row_action, indptr, succ, prob, bust) of the given hands.
+
+    row_state indexes into states; successors are ranked with table, and
+    busting draws point at the sink index n.
+    """
+    values = np.array(CARD_VALUE, dtype=np.int64)
+    order = np.array(CARD_ORDER)
+    held = ((states[:, None] >> order) & 1).astype(bool)
+    row_state, row_action, row_len, succ, bust = [], [], [], [], []
+    for a in range(27):
+        if a == 0:
+            rows = np.arange(len(states))
+            base = states
+            base_sum = sums
+        else:
+            rows = np.flatnonzero((states >> (a - 1)) & 1)
+            base = states[rows] & ~(1 << (a - 1))
+            base_sum = sums[rows] - CARD_VALUE[a - 1]
+        avail = ~held[rows]
+        r, k = np.nonzero(avail)
+        nxt = base[r] | (np.int64(1) << order[k])
+        busted = base_sum[r] + values[order[k]] >= threshold
+        idx = np.full(len(r), n, dtype=np.int32)
+        idx[~busted] = rank_hands(nxt[~busted], table)
+        row_state.append(rows)
+        row_action.append(np.full(len(rows), a))
+        row_len.append(avail.sum(axis=1))
+        succ.append(idx)
+        bust.append(busted)
+    lengths = np.concatenate(row_len)
+    indptr = np.concatenate(([0], np.cumsum(lengths)))
+    prob = np.repeat(1.0 / lengths, lengths)
+    return np.concatenate(row_state), np.concatenate(row_action), indptr, np.concatenate(succ), prob, np.concatenate(bust)
+
+class Transitions:
+    """CSR successor structure of the card MDP.
+
+    Row k is the pair (row_state[k], row_action[k]) for PULL (0) or a legal
+    SWAP (1..26); its successors are succ[indptr[k]:indptr[k+1]], reached
+    with probability prob. Busting successors point at the sink index n
+    (value 0) and are flagged in bust. STOP (27) pays reward.
+    """
+
+    def __init__(self, threshold, bonus, sequence, table=None):
+        start = time.perf_counter()
+        if table is None:
+            table = build_rank_table(threshold)
+        self.threshold = threshold
+        self.table = table
+        self.num_actions = 28
+        self.states = unrank_hands(np.arange(num_hands(table)), table)
+        n = len(self.states)
+        self.n = n
+        counts = value_counts(self.states)
+        self.counts = counts.astype(np.int8)
+        self.base_index = np.arange(n)
+        sums = counts @ np.arange(1, 14)
+        self.reward = sums + bonus * special_sequence_mask(counts, sequence)
+        enumerated = time.perf_counter()
+
+        (self.row_state, self.row_action, self.indptr, self.succ, self.prob,
+         self.bust) = successor_rows(self.states, sums, threshold, table, n)
+        self.timings = {"enumerate": enumerated - start, "successors": time.perf_counter() - enumerated}
+
+    def q_values(self, V):
+        """Action values for every state, shape (n, num_actions); illegal SWAPs are 0."""
+        V_ext = np.append(V, 0.0)
+        Q = np.zeros((self.n, self.num_actions))
+        Q[self.row_state, self.row_action] = np.add.reduceat(V_ext[self.succ] * self.prob, self.indptr[:-1])
+        Q[:, -1] = self.reward
+        return Q
+
+    def solution(self, V, policy):
+        """Arrays decode_hands needs to answer queries for this configuration."""
+        return {"value": V, "policy": policy.astype(np.uint8)}
+
+    def build_table(self, threshold):
+        return build_rank_table(threshold)
+
+    def restrict(self, threshold, bonus, sequence):
+        """This MDP at a threshold no larger than self.threshold, without re-enumerating.
+
+        Filtering the lexicographically ordered states keeps them in rank
+        order, so the result is indexed exactly like a fresh build.
+        base_index records where each state sits in the unrestricted MDP.
+        """
+        if threshold > self.threshold:
+            raise ValueError(f"cannot restrict threshold {self.threshold} to {threshold}")
+        start = time.perf_counter()
+        sums = self.counts @ np.arange(1, 14)
+        keep = sums < threshold
+        n = int(keep.sum())
+        # Dropped states and the old sink both map to the new sink n.
+        new_index = np.append(np.where(keep, np.cumsum(keep) - 1, n), n)
+        rows = np.flatnonzero(keep[self.row_state])
+        entries = row_entries(self.indptr, rows)
+        sub = object.__new__(type(self))
+        sub.__dict__.update(self.__dict__)
+        sub.threshold = threshold
+        sub.table = self.build_table(threshold)
+        sub.states = self.states[keep]
+        sub.counts = self.counts[keep]
+        sub.base_index = self.base_index[keep]
+        sub.n = n
+        sub.reward = sums[keep] + bonus * special_sequence_mask(sub.counts, sequence)
+        sub.row_state = new_index[self.row_state[rows]]
+        sub.row_action = self.row_action[rows]
+        sub.indptr = np.concatenate(([0], np.cumsum(np.diff(self.indptr)[rows])))
+        sub.succ = new_index[self.succ[entries]].astype(self.succ.dtype)
+        sub.prob = self.prob[entries]
+        sub.bust = sub.succ == n
+        sub.timings = {"enumerate": 0.0, "successors": time.perf_counter() - start}
+        return sub
+
+class SymmetricTransitions:
+    """The card MDP over value-count vectors (0..num_suits copies of each rank).
+
+    Rewards and busts depend only on card values, so hands that differ by a
+    permutation of suits share one canonical state. Same CSR layout as
+    Transitions, with actions PULL (0), SWAP rank v (1..13) and STOP (14);
+    draws are weighted by the copies of each rank left in the deck.
+    """
+
+    def __init__(self, threshold, bonus, sequence, num_suits=2, table=None):
+        start = time.perf_counter()
+        if table is None:
+            table = build_count_table(threshold, num_suits)
+        self.threshold = threshold
+        self.num_suits = num_suits
+        self.table = table
+        self.num_actions = 15
+        self.states = unrank_counts(np.arange(table[0][-1] if table[0] else 0), table, num_suits).astype(np.int8)
+        n = len(self.states)
+        self.n = n
+        self.counts = self.states
+        self.base_index = np.arange(n)
+        sums = self.states @ np.arange(1, 14)
+        self.reward = sums + bonus * special_sequence_mask(self.states, sequence)
+        enumerated = time.perf_counter()
+
+        left = num_suits - self.states
+        deck = left.sum(axis=1)
+        row_state, row_action, row_len, succ, prob, bust = [], [], [], [], [], []
+        for a in range(14):
+            if a == 0:
+                rows = np.arange(n)
+                base_sum = sums
+            else:
+                rows = np.flatnonzero(self.states[:, a - 1] > 0)
+                base_sum = sums[rows] - a
+            avail = left[rows] > 0
+            # One draw rank at a time keeps the temporaries at one row per state.
+            idx = np.full(avail.shape, -1, dtype=np.int32)
+            for w in range(13):
+                r = np.flatnonzero(avail[:, w])
+                busted = base_sum[r] + w + 1 >= threshold
+                nxt = self.states[rows[r[~busted]]]
+                if a:
+                    nxt[:, a - 1] -= 1
+                nxt[:, w] += 1
+                idx[r, w] = n
+                idx[r[~busted], w] = rank_counts(nxt, table)
+            r, w = np.nonzero(avail)
+            row_state.append(rows)
+            row_action.append(np.full(len(rows), a))
+            row_len.append(avail.sum(axis=1))
+            succ.append(idx[r, w])
+            prob.append(left[rows[r], w] / deck[rows[r]])
+            bust.append(idx[r, w] == n)
+        self.row_state = np.concatenate(row_state)
+        self.row_action = np.concatenate(row_action)
+        self.indptr = np.concatenate(([0], np.cumsum(np.concatenate(row_len))))
+        self.succ = np.concatenate(succ)
+        self.prob = np.concatenate(prob)
+        self.bust = np.concatenate(bust)
+        self.timings = {"enumerate": enumerated - start, "successors": time.perf_counter() - enumerated}
+
+    q_values = Transitions.q_values
+
+    def solution(self, V, policy):
+        return {"value": V, "policy": policy.astype(np.uint8), "q": self.q_values(V)}
+
+    def build_table(self, threshold):
+        return build_count_table(threshold, self.num_suits)
+
+    restrict = Transitions.restrict
+
+def decode_hands(hands, threshold, solution, num_suits=2):
+    """Actions for a batch of hand masks; hands at or over the threshold STOP.
+
+    With a symmetric solution, SWAP rank v becomes SWAP id s * 13 + v for
+    each held suit s, and ties go to the lowest id, as in the full-deck solver.
+    """
+    hands = np.asarray(hands, dtype=np.int64)
+    stop = 13 * num_suits + 1
+    actions = np.full(len(hands), stop)
+    counts = value_counts(hands, num_suits)
+    live = counts @ np.arange(1, 14) < threshold
+    if "q" not in solution:
+        actions[live] = solution["policy"][rank_hands(hands[live], build_rank_table(threshold))]
+        return actions
+    Q = solution["q"][rank_counts(counts[live], build_count_table(threshold, num_suits))]
+    held = ((hands[live, None] >> np.arange(13 * num_suits)) & 1).astype(bool)
+    concrete = np.zeros((len(Q), stop + 1))
+    concrete[:, 0] = Q[:, 0]
+    concrete[:, 1:stop] = np.where(held, np.tile(Q[:, 1:14], num_suits), 0)
+    concrete[:, stop] = Q[:, -1]
+    actions[live] = concrete.argmax(axis=1)
+    return actions
+
+# --- Planner output ---
+# The encoder numbers the hands (as sorted (num, suit) tuples) in sorted
+# order and appends the BUST and STOP terminals; the planner prints one
+# "value action" line per encoder state in that order.
+ENCODER_CARD_ORDER = [card_to_bit(num, suit) for num in range(1, 14) for suit in sorted(SUITS)]
+
+def encoder_order(masks):
+    """Permutation sorting hand masks into encoder state order."""
+    masks = np.asarray(masks, dtype=np.int64)
+    held = ((masks[:, None] >> np.array(ENCODER_CARD_ORDER)) & 1).astype(bool)
+    width = int(held.sum(axis=1).max(initial=0))
+    if width == 0:
+        # only the empty hand (threshold 1): np.lexsort needs at least one key
+        return np.arange(len(masks))
+    # Sorted card positions, padded with -1 so a prefix sorts before its extensions.
+    keys = np.sort(np.where(held, np.arange(NUM_CARDS), NUM_CARDS), axis=1)[:, :width]
+    keys[keys == NUM_CARDS] = -1
+    return np.lexsort(keys.T[::-1])
+
+def read_value_policy(path):
+    """Values and actions of a planner output file."""
+    fields = mdp_arrays.read_columns(path, 2)
+    return fields[:, 0], fields[:, 1].astype(np.uint8)
+
+def encode_mdp(threshold, bonus, sequence, trans=None):
+    """The card game as an ArrayMDP in encoder state order, BUST = n and STOP = n + 1.
+
+    All busting draws of a (state, action) pair are merged into one BUST
+    transition; STOP moves to the STOP terminal and carries the reward.
+    """
+    if trans is None:
+        trans = Transitions(threshold, bonus, sequence)
+    n = trans.n
+    encoder_id = np.empty(n + 1, dtype=np.int32)
+    encoder_id[encoder_order(trans.states)] = np.arange(n)
+    encoder_id[n] = n
+    lengths = np.diff(trans.indptr)
+    entry_row = np.repeat(np.arange(len(lengths)), lengths)
+    live = ~trans.bust
+    bust_prob = np.bincount(entry_row, weights=trans.prob * trans.bust, minlength=len(lengths))
+    busts = np.flatnonzero(bust_prob > 0)
+    s = np.concatenate((trans.row_state[entry_row[live]], trans.row_state[busts], np.arange(n)))
+    a = np.concatenate((trans.row_action[entry_row[live]], trans.row_action[busts], np.full(n, 27)))
+    s_next = np.concatenate((encoder_id[trans.succ[live]], np.full(len(busts), n), np.full(n, n + 1)))
+    r = np.concatenate((np.zeros(live.sum() + len(busts)), trans.reward))
+    p = np.concatenate((trans.prob[live], bust_prob[busts], np.ones(n)))
+    order = np.lexsort((s_next, a, encoder_id[s]))
+    return mdp_arrays.ArrayMDP(n + 2, 28, encoder_id[s][order], a[order], s_next[order], r[order], p[order],
+                               end=[n, n + 1], mdptype="episodic", discount=1.0)
+
+def encoder_solution(values, threshold, bonus, sequence):
+    """decode_hands solution arrays from planner values indexed by encoder state.
+
+    The planner's own action column is not used: its action numbers need
+    not be ours, so the policy is recomputed with one greedy backup of the
+    values, which also keeps every SWAP legal for its hand.
+    """
+    table = build_rank_table(threshold)
+    n = num_hands(table)
+    if len(values) not in (n, n + 2):
+        raise ValueError(f"got {len(values)} states, expected {n + 2} for threshold {threshold}")
+    V = np.empty(n)
+    V[encoder_order(unrank_hands(np.arange(n), table))] = values[:n]
+    trans = Transitions(threshold, bonus, sequence, table)
+    return trans.solution(V, greedy_actions(trans.q_values(V)))
+
+def planner_solution(path, threshold, bonus, sequence):
+    """decode_hands solution arrays built from planner output instead of solved."""
+    values, _ = read_value_policy(path)
+    try:
+        return encoder_solution(values, threshold, bonus, sequence)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+def write_policy_listing(out, threshold, solution, block=1 << 14):
+    """Write "hand -> action" for every live hand, in encoder order, a block at a time."""
+    table = build_rank_table(threshold)
+    masks = unrank_hands(np.arange(num_hands(table)), table)
+    masks = masks[encoder_order(masks)]
+    names = [f"{num}{suit}" for num, suit in map(bit_to_card, ENCODER_CARD_ORDER)]
+    bits = np.array(ENCODER_CARD_ORDER)
+    for lo in range(0, len(masks), block):
+        chunk = masks[lo:lo + block]
+        held = ((chunk[:, None] >> bits) & 1).astype(bool)
+        actions = decode_hands(chunk, threshold, solution).tolist()
+        out.write("".join(" ".join(itertools.compress(names, row)) + f" -> {a}\n"
+                          for row, a in zip(held.tolist(), actions)))
+
+def value_iteration(trans, stats=None, policy0=None):
+    V = warm_start(trans, policy0)
+    if V is None:
+        V = np.zeros(trans.n)
+        policy = np.full(trans.n, trans.num_actions - 1)
+    else:
+        policy = np.asarray(policy0)
 
     max_iterations = 100
     tolerance = 1e-6
-    
+    residuals = []
+
     for iteration in range(max_iterations):
-        V_new = V.copy()
-        policy_changed = False
-        
-        for s, state in enumerate(states):
-            if state in terminal_states:
-                continue
-            best_val = -1
-            best_action = 27
-            hand = state
-
-            remaining = [c for c in all_cards if c not in hand]
-            val_add = 0
-            if remaining:
-                prob = 1.0 / len(remaining)
-                for c in remaining:
-                    new_hand = tuple(sorted(hand + (c,)))
-                    if sum(card[0] for card in new_hand) >= threshold:
-                        val_add += prob * 0
-                    else:
-                        val_add += prob * V[state_to_idx[new_hand]]
-            else:
-                val_add = 0
-            if val_add > best_val:
-                best_val = val_add
-                best_action = 0
-
-            for a in range(1, 27):
-                if a <= 13:
-                    swap_card = (a, 'H')
-                else:
-                    swap_card = (a - 13, 'D')
-                val_swap = 0
-                if swap_card in hand and remaining:
-                    prob = 1.0 / len(remaining)
-                    for c in remaining:
-                        new_hand = list(hand)
-                        new_hand.remove(swap_card)
-                        new_hand.append(c)
-                        new_hand = tuple(sorted(new_hand))
-                        if sum(card[0] for card in new_hand) >= threshold:
-                            val_swap += 0
-                        else:
-                            val_swap += V[state_to_idx[new_hand]] * prob
-                else:
-                    val_swap = 0
-                if val_swap > best_val:
-                    best_val = val_swap
-                    best_action = a
-
-            reward = sum(card[0] for card in hand)
-            if check_special_sequence(hand, sequence):
-                reward += bonus
-            if reward > best_val:
-                best_val = reward
-                best_action = 27
-
-            # Update V and policy
-            if abs(V_new[s] - best_val) > tolerance:
-                policy_changed = True
-            V_new[s] = best_val
-            if policy[s] != best_action:
-                policy_changed = True
-            policy[s] = best_action
-
-        # Check for convergence
-        V = V_new
+        Q = trans.q_values(V)
+        # argmax keeps the first best action, matching the strict > scan order
+        new_policy = Q.argmax(axis=1)
+        V_new = Q[np.arange(trans.n), new_policy]
+        residual = np.abs(V_new - V).max(initial=0)
+        residuals.append(float(residual))
+        policy_changed = residual > tolerance or np.any(new_policy != policy)
+        V, policy = V_new, new_policy
         if not policy_changed:
             break
 
-    return state_to_idx, policy
+    if stats is not None:
+        stats.update(iterations=iteration + 1, backups=(iteration + 1) * trans.n, residual=float(residual),
+                     residuals=residuals)
+    return V, policy
+
+def greedy_actions(Q, tolerance=1e-9):
+    """First action within tolerance of the best, so exact ties do not hinge on rounding."""
+    best = Q.max(axis=1, keepdims=True)
+    return (Q >= best - tolerance * np.maximum(1.0, np.abs(best))).argmax(axis=1)
+
+def warm_start(trans, policy0):
+    """Exact values of policy0 to start a solver from, or None if there is no usable policy0.
 
+    The values of a policy that stops with probability 1 are a lower bound
+    on the optimum that the Bellman update can only raise, so every solver
+    converges from them. A policy that can loop forever gives a singular
+    evaluation and is rejected.
+    """
+    if policy0 is None:
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        V = evaluate_policy(trans, policy0)
+    if not np.all(np.isfinite(V)):
+        return None
+    Q = trans.q_values(V)
+    if np.abs(Q[np.arange(trans.n), policy0] - V).max(initial=0) > 1e-9 * (1 + np.abs(V).max(initial=0)):
+        return None
+    return V
+
+def prioritized_sweeping(trans, tolerance=1e-6, stats=None, policy0=None, fraction=0.5):
+    """In-place (Gauss-Seidel) backups of the states with the largest residual bounds.
+
+    prio[s] always bounds the Bellman residual of s: it starts at the exact
+    residual, drops to 0 when s is backed up and grows by reach[s] * |change|
+    whenever a successor of s is backed up. Each round backs up, as one
+    block of sparse products, every state whose bound is within fraction of
+    the largest. Solving stops once every bound is below tolerance, so there
+    is no iteration cap; the final residual is then measured with one full sweep.
+    """
+    n = trans.n
+    # P shares the arrays of trans; rows lists its rows in state order, so
+    # the rows of state s are rows[state_ptr[s]:state_ptr[s + 1]].
+    P = sp.csr_matrix((trans.prob, trans.succ, trans.indptr), shape=(len(trans.row_state), n + 1), copy=False)
+    rows = np.argsort(trans.row_state, kind="stable")
+    state_ptr = np.searchsorted(trans.row_state[rows], np.arange(n + 1))
+    # reach[p] is the largest probability of any single draw from p, so a
+    # change of delta in V[s] moves the residual of each predecessor p of s
+    # by at most reach[p] * delta. Row s of pred holds reach[p] for every p.
+    reach = np.zeros(n)
+    np.maximum.at(reach, trans.row_state, np.maximum.reduceat(trans.prob, trans.indptr[:-1]))
+    live = trans.succ < n
+    entry_state = np.repeat(trans.row_state.astype(np.int32), np.diff(trans.indptr))[live]
+    pred = sp.csr_matrix((np.ones(len(entry_state)), (trans.succ[live], entry_state)), shape=(n, n))
+    del live, entry_state
+    pred.data = reach[pred.indices]
+
+    V = trans.reward.astype(float)
+    V0 = warm_start(trans, policy0)
+    if V0 is not None:
+        V = np.maximum(V, V0)
+    V_ext = np.append(V, 0.0)
+    prio = np.abs(trans.q_values(V).max(axis=1) - V)
+    backups = rounds = 0
+    while True:
+        top = prio.max(initial=0)
+        if top < tolerance:
+            break
+        block = np.flatnonzero(prio >= max(tolerance, fraction * top))
+        prio[block] = 0
+        # Every state has a PULL row, so no segment of the reduceat is empty.
+        counts = np.diff(state_ptr)[block]
+        q = P[rows[row_entries(state_ptr, block)]] @ V_ext
+        best = np.maximum(trans.reward[block], np.maximum.reduceat(q, np.cumsum(counts) - counts))
+        delta = best - V_ext[block]
+        V_ext[block] = best
+        backups += len(block)
+        rounds += 1
+        moved = delta != 0
+        prio += pred[block[moved]].T @ np.abs(delta[moved])
+
+    V = V_ext[:n]
+    Q = trans.q_values(V)
+    policy = greedy_actions(Q)
+    if stats is not None:
+        stats.update(iterations=rounds, backups=backups, residual=float(np.abs(Q.max(axis=1) - V).max(initial=0)))
+    return V, policy
+
+def evaluate_policy(trans, policy):
+    """Exact values of a deterministic policy: one sparse solve of (I - P) V = r."""
+    n = trans.n
+    row_of = np.full((n, trans.num_actions), -1)
+    row_of[trans.row_state, trans.row_action] = np.arange(len(trans.row_state))
+    rows = row_of[np.arange(n), policy]
+    moving = rows >= 0
+    lengths = np.zeros(n, dtype=np.int64)
+    lengths[moving] = trans.indptr[rows[moving] + 1] - trans.indptr[rows[moving]]
+    entries = row_entries(trans.indptr, rows[moving])
+    indptr = np.concatenate(([0], np.cumsum(lengths)))
+    # Busting successors land in column n, which is dropped: their value is 0.
+    P = sp.csr_matrix((trans.prob[entries], trans.succ[entries], indptr), shape=(n, n + 1))[:, :n]
+    b = np.where(moving, 0.0, trans.reward)
+    return spla.spsolve((sp.identity(n, format="csr") - P).tocsc(), b) if n else np.zeros(0)
+
+def policy_iteration(trans, stats=None, policy0=None):
+    """Howard policy iteration from policy0, or from the all-STOP policy.
+
+    A state only switches action on a strict improvement, which keeps every
+    policy proper (it stops with probability 1), so each evaluation is a
+    nonsingular linear solve and the loop ends once no state switches.
+    """
+    n = trans.n
+    V = warm_start(trans, policy0)
+    if V is None:
+        policy = np.full(n, trans.num_actions - 1)
+        V = trans.reward.astype(float)
+    else:
+        policy = np.asarray(policy0)
+    iterations = 0
+    residuals = []
+    while True:
+        iterations += 1
+        Q = trans.q_values(V)
+        residuals.append(float(np.abs(Q.max(axis=1) - V).max(initial=0)))
+        best = Q.argmax(axis=1)
+        current = Q[np.arange(n), policy]
+        switch = Q[np.arange(n), best] > current + 1e-12 * np.maximum(1.0, np.abs(current))
+        if not switch.any():
+            break
+        policy = np.where(switch, best, policy)
+        V = evaluate_policy(trans, policy)
+
+    if stats is not None:
+        stats.update(iterations=iterations, residual=residuals[-1], residuals=residuals)
+    return V, greedy_actions(Q)
+
+SOLVERS = {"vi": value_iteration, "ps": prioritized_sweeping, "pi": policy_iteration}
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+def compute_policy(threshold, bonus, sequence, symmetric=False, solver="vi", stats=None):
+    if symmetric:
+        trans = SymmetricTransitions(threshold, bonus, sequence)
+    else:
+        trans = Transitions(threshold, bonus, sequence)
+    start = time.perf_counter()
+    V, policy = SOLVERS[solver](trans, stats=stats)
+    if stats is not None:
+        solve = time.perf_counter() - start
+        stats.update(solver=solver, symmetric=symmetric, states=trans.n, rows=len(trans.row_state),
+                     entries=len(trans.succ), phases=dict(trans.timings, solve=solve), peak_rss_mb=peak_rss_mb())
+        if "backups" in stats:
+            stats["backups_per_second"] = stats["backups"] / solve if solve > 0 else None
+    return trans, V, policy
+
+def open_array(work_dir, name, dtype, shape):
+    return np.lib.format.open_memmap(os.path.join(work_dir, name + ".npy"), mode="w+", dtype=dtype, shape=shape)
+
+def solve_out_of_core(threshold, bonus, sequence, work_dir, chunk_size=1 << 13, dtype=np.float32, stats=None):
+    """Synchronous value iteration with every per-state array memory-mapped under work_dir.
+
+    States, rewards, values and the policy are .npy files, and the successor
+    rows of each chunk of chunk_size states are written once and re-read
+    every sweep, so only one chunk is resident at a time and the solvable
+    size is bounded by disk. Returns the solution dict decode_hands takes,
+    backed by the files in work_dir.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    start = time.perf_counter()
+    table = build_rank_table(threshold)
+    n = num_hands(table)
+    states = open_array(work_dir, "states", np.int32, (n,))
+    reward = open_array(work_dir, "reward", dtype, (n,))
+    chunk_arrays = ["row_state", "row_action", "indptr", "succ"]
+    chunks = []
+    for c, lo in enumerate(range(0, n, chunk_size)):
+        hi = min(lo + chunk_size, n)
+        masks = unrank_hands(np.arange(lo, hi), table)
+        counts = value_counts(masks)
+        sums = counts @ np.arange(1, 14)
+        states[lo:hi] = masks
+        reward[lo:hi] = sums + bonus * special_sequence_mask(counts, sequence)
+        row_state, row_action, indptr, succ, _, _ = successor_rows(masks, sums, threshold, table, n)
+        arrays = [row_state.astype(np.int32), row_action.astype(np.uint8), indptr, succ]
+        for name, arr in zip(chunk_arrays, arrays):
+            np.save(os.path.join(work_dir, f"chunk{c}_{name}.npy"), arr)
+        chunks.append((c, lo, hi))
+    built = time.perf_counter()
+
+    # Two value files for the synchronous update; index n is the sink and stays 0.
+    value = open_array(work_dir, "value", dtype, (n + 1,))
+    V, V_next = value, open_array(work_dir, "value_next", dtype, (n + 1,))
+    policy = open_array(work_dir, "policy", np.uint8, (n,))
+    policy[:] = 27
+    max_iterations = 100
+    # A float32 value cannot resolve changes much below its own rounding error.
+    tolerance = max(1e-6, 4 * np.finfo(dtype).eps * float(np.abs(reward).max(initial=0)))
+    residuals = []
+    for iteration in range(max_iterations):
+        residual, policy_changed = 0.0, False
+        for c, lo, hi in chunks:
+            row_state, row_action, indptr, succ = (np.load(os.path.join(work_dir, f"chunk{c}_{name}.npy"), mmap_mode="r")
+                                                   for name in chunk_arrays)
+            lengths = np.diff(indptr)
+            Q = np.zeros((hi - lo, 28))
+            Q[row_state, row_action] = np.add.reduceat(V[succ].astype(float) * np.repeat(1.0 / lengths, lengths),
+                                                       indptr[:-1])
+            Q[:, -1] = reward[lo:hi]
+            new_policy = Q.argmax(axis=1)
+            best = Q[np.arange(hi - lo), new_policy]
+            residual = max(residual, float(np.abs(best - V[lo:hi]).max(initial=0)))
+            policy_changed = policy_changed or bool(np.any(new_policy != policy[lo:hi]))
+            V_next[lo:hi] = best
+            policy[lo:hi] = new_policy
+        V, V_next = V_next, V
+        residuals.append(residual)
+        if residual <= tolerance and not policy_changed:
+            break
+    # After an odd number of sweeps the result is in value_next.npy
+    if V is not value:
+        for lo in range(0, n + 1, chunk_size):
+            value[lo:lo + chunk_size] = V[lo:lo + chunk_size]
+        V = value
+    V.flush()
+    policy.flush()
+
+    if stats is not None:
+        solve = time.perf_counter() - built
+        stats.update(solver="vi-mmap", states=n, chunks=len(chunks), iterations=iteration + 1,
+                     backups=(iteration + 1) * n, residual=residual, residuals=residuals,
+                     phases={"build": built - start, "solve": solve}, peak_rss_mb=peak_rss_mb(),
+                     disk_mb=policy_cache.entry_size(work_dir) / 2**20)
+        stats["backups_per_second"] = stats["backups"] / solve if solve > 0 else None
+    return {"value": V[:n], "policy": policy}
+
+def format_stats(stats):
+    """Human-readable version of the stats compute_policy and load_or_solve fill in."""
+    lines = []
+    for key in ("cache", "solver", "states", "rows", "entries", "iterations", "backups", "backups_per_second", "residual"):
+        if stats.get(key) is not None:
+            value = stats[key]
+            lines.append(f"{key:<20}{value:.3g}" if isinstance(value, float) else f"{key:<20}{value}")
+    for phase, seconds in stats.get("phases", {}).items():
+        lines.append(f"{phase + ' (s)':<20}{seconds:.3f}")
+    if stats.get("peak_rss_mb") is not None:
+        lines.append(f"{'peak RSS (MB)':<20}{stats['peak_rss_mb']:.1f}")
+    if stats.get("residuals"):
+        lines.append("residual per sweep  " + " ".join(f"{r:.2e}" for r in stats["residuals"]))
+    return "\n".join(lines)
+
+
+def solve_sweep(configs, symmetric=False, solver="vi", stats=None):
+    """Solve (threshold, bonus, sequence) configurations in the given order.
+
+    States are enumerated once, for the largest threshold, and every
+    configuration restricts that MDP instead of rebuilding it. Each solve
+    starts from the previous configuration's policy. Yields
+    (config, transitions, V, policy); stats, if given, collects one dict per
+    configuration.
+    """
+    configs = [(threshold, bonus, list(sequence)) for threshold, bonus, sequence in configs]
+    if not configs:
+        return
+    top = max(threshold for threshold, _, _ in configs)
+    base = SymmetricTransitions(top, 0, []) if symmetric else Transitions(top, 0, [])
+    prev = None
+    for threshold, bonus, sequence in configs:
+        trans = base.restrict(threshold, bonus, sequence)
+        policy0 = None
+        if prev is not None:
+            full = np.full(base.n, trans.num_actions - 1)
+            full[prev[0].base_index] = prev[1]
+            policy0 = full[trans.base_index]
+        config_stats = {}
+        V, policy = SOLVERS[solver](trans, stats=config_stats, policy0=policy0)
+        if stats is not None:
+            stats.append(config_stats)
+        prev = (trans, policy)
+        yield (threshold, bonus, sequence), trans, V, policy
+
+def load_or_solve(threshold, bonus, sequence, symmetric=False, solver="vi", cache_dir=policy_cache.DEFAULT_DIR,
+                  max_bytes=policy_cache.DEFAULT_MAX_BYTES, stats=None):
+    """Solution arrays for a configuration, from the policy cache when possible.
+
+    Pass cache_dir=None to always solve.
+    """
+    if stats is not None:
+        stats["cache"] = "off" if cache_dir is None else "miss"
+    if cache_dir is not None:
+        name = solver + "-sym" if symmetric else solver
+        key = policy_cache.cache_key(threshold, bonus, sequence, name, CACHE_VERSION)
+        solution = policy_cache.load(cache_dir, key)
+        if solution is not None:
+            if stats is not None:
+                stats.update(cache="hit", states=len(solution["value"]))
+            return solution
+    trans, V, policy = compute_policy(threshold, bonus, sequence, symmetric, solver, stats)
+    solution = trans.solution(V, policy)
+    if cache_dir is not None:
+        policy_cache.store(cache_dir, key, solution, max_bytes)
+    return solution
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--value_policy", required=False, help="Output from planner")
-    parser.add_argument("--testcase", required=True, help="Test case file")
-    parser.add_argument("--automate", required=False, help="Config file for automate mode")
+    parser.add_argument("--value_policy", required=False, help="Output from planner; used instead of solving")
+    parser.add_argument("--testcase", required=False, help="Test case file")
+    parser.add_argument("--automate", required=False, help="Config file for automate mode: list the action of every hand")
+    parser.add_argument("--symmetric", action="store_true", help="Solve over suit-symmetric value counts")
+    parser.add_argument("--solver", choices=sorted(SOLVERS), default="vi", help="vi: synchronous value iteration, ps: prioritized sweeping, pi: policy iteration")
+    parser.add_argument("--cache_dir", default=policy_cache.DEFAULT_DIR, help="Directory of solved policies")
+    parser.add_argument("--cache_mb", type=int, default=policy_cache.DEFAULT_MAX_BYTES // 2**20, help="Policy cache size cap in MB")
+    parser.add_argument("--no_cache", action="store_true", help="Always re-solve and leave the cache untouched")
+    parser.add_argument("--stats", choices=["text", "json"], default=None, help="Report solver statistics on stderr")
+    parser.add_argument("--profile", action="store_true", help="Profile the solve with cProfile and print the top functions on stderr")
+    parser.add_argument("--mmap_dir", default=None, help="Solve out of core with memory-mapped arrays in this directory")
+    parser.add_argument("--chunk_size", type=int, default=1 << 13, help="States per chunk in --mmap_dir mode")
+    parser.add_argument("--mmap_dtype", choices=["float32", "float64"], default="float32", help="Value dtype in --mmap_dir mode")
     args = parser.parse_args()
+    if args.mmap_dir and (args.symmetric or args.solver != "vi"):
+        parser.error("--mmap_dir runs full-deck value iteration only")
+    if not (args.testcase or args.automate):
+        parser.error("give --testcase and/or --automate")
 
-    threshold, bonus, sequence = parse_game_config(args.testcase)
-    state_to_idx, policy = compute_policy(threshold, bonus, sequence)
+    threshold, bonus, sequence = parse_game_config(args.automate or args.testcase)
+    cache_dir = None if args.no_cache else args.cache_dir
+    stats = {}
+    if args.profile:
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if args.value_policy:
+        solution = planner_solution(args.value_policy, threshold, bonus, sequence)
+    elif args.mmap_dir:
+        solution = solve_out_of_core(threshold, bonus, sequence, args.mmap_dir, args.chunk_size, np.dtype(args.mmap_dtype), stats)
+    else:
+        solution = load_or_solve(threshold, bonus, sequence, args.symmetric, args.solver, cache_dir, args.cache_mb * 2**20, stats)
+    if args.profile:
+        profiler.disable()
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(15)
+    if args.stats == "json":
+        print(json.dumps(stats), file=sys.stderr)
+    elif args.stats == "text":
+        print(format_stats(stats), file=sys.stderr)
 
-    test_hands = parse_testcase(args.testcase)
-
-    for hand in test_hands:
-        idx = state_to_idx.get(hand, None)
-        if idx is None:
-            print(27)
-        else:
-            print(policy[idx])
+    if args.automate:
+        write_policy_listing(sys.stdout, threshold, solution)
+    if args.testcase:
+        test_hands = parse_testcase(args.testcase)
+        for action in decode_hands(test_hands, threshold, solution):
+            print(action)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+import decoder
+import policy_cache
+
+# Line-delimited JSON protocol, one request per line:
+#   {"queries": [{"threshold": 18, "bonus": 0, "sequence": [4, 5, 6],
+#                 "hands": ["1H 5D 4H", "2D 3D"]}, ...],   (or hand masks)
+#    "symmetric": false, "solver": "vi"}
+# answered by {"actions": [[18, 15], ...]} or {"error": "..."}.
+DEFAULT_SOCKET = "/tmp/decoder.sock"
+
+
+class DecoderService:
+    """Answers batches of queries, keeping every solved configuration in memory."""
+
+    def __init__(self, cache_dir=policy_cache.DEFAULT_DIR):
+        self.cache_dir = cache_dir
+        self.solutions = {}
+        # self.lock guards the two dicts only; a configuration being solved
+        # holds its own lock in self.solving, so other clients keep being
+        # answered meanwhile
+        self.solving = {}
+        self.lock = threading.Lock()
+
+    def solution(self, threshold, bonus, sequence, symmetric, solver):
+        key = (threshold, bonus, tuple(sequence), symmetric, solver)
+        with self.lock:
+            if key in self.solutions:
+                return self.solutions[key]
+            key_lock = self.solving.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                if key in self.solutions:
+                    return self.solutions[key]
+            try:
+                solution = decoder.load_or_solve(threshold, bonus, sequence, symmetric, solver, self.cache_dir)
+                with self.lock:
+                    self.solutions[key] = solution
+            finally:
+                with self.lock:
+                    self.solving.pop(key, None)
+        return solution
+
+    def handle(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("a request is a JSON object")
+        symmetric = bool(request.get("symmetric", False))
+        solver = request.get("solver", "vi")
+        if solver not in decoder.SOLVERS:
+            raise ValueError(f"unknown solver {solver!r}")
+        actions = []
+        for query in request["queries"]:
+            threshold, bonus, sequence = int(query["threshold"]), int(query["bonus"]), list(map(int, query["sequence"]))
+            solution = self.solution(threshold, bonus, sequence, symmetric, solver)
+            hands = [hand if isinstance(hand, int) else decoder.parse_hand(hand) for hand in query["hands"]]
+            if any(not 0 <= hand < 1 << decoder.NUM_CARDS for hand in hands):
+                raise ValueError(f"hand masks are {decoder.NUM_CARDS}-bit")
+            actions.append(decoder.decode_hands(hands, threshold, solution).tolist())
+        return {"actions": actions}
+
+    def reply(self, line):
+        # line is a str or UTF-8 bytes; json.loads decodes the bytes, so a
+        # line that is not UTF-8 is answered with an error like any other
+        try:
+            return json.dumps(self.handle(json.loads(line)))
+        except Exception as e:
+            # Any bad request gets an error reply; it must not end the session
+            return json.dumps({"error": f"{type(e).__name__}: {e}"})
+
+
+def serve_stdio(service):
+    for line in sys.stdin.buffer:
+        if line.strip():
+            sys.stdout.write(service.reply(line) + "\n")
+            sys.stdout.flush()
+
+def serve_socket(service, path):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write((service.reply(line) + "\n").encode())
+                    self.wfile.flush()
+
+    if os.path.exists(path):
+        os.remove(path)
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
+class DecoderClient:
+    """Client for a decoder_server.py listening on a Unix socket."""
+
+    def __init__(self, path=DEFAULT_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.file = self.sock.makefile("rwb")
+        # One request in flight at a time, so threads can share a client.
+        self.lock = threading.Lock()
+
+    def request(self, request):
+        with self.lock:
+            self.file.write((json.dumps(request) + "\n").encode())
+            self.file.flush()
+            reply = json.loads(self.file.readline())
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def query_batch(self, queries, symmetric=False, solver="vi"):
+        """Actions for a list of (threshold, bonus, sequence, hands) queries."""
+        request = {"queries": [{"threshold": t, "bonus": b, "sequence": list(seq), "hands": list(hands)}
+                               for t, b, seq, hands in queries],
+                   "symmetric": symmetric, "solver": solver}
+        return self.request(request)["actions"]
+
+    def query(self, threshold, bonus, sequence, hands, symmetric=False, solver="vi"):
+        return self.query_batch([(threshold, bonus, sequence, hands)], symmetric, solver)[0]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+def connect(path=DEFAULT_SOCKET, start=True, timeout=10.0):
+    """Connect to the server at path, starting one in the background if none is running."""
+    try:
+        return DecoderClient(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not start:
+            raise
+    here = os.path.dirname(os.path.abspath(__file__))
+    subprocess.Popen([sys.executable, os.path.join(here, "decoder_server.py"), "--socket", path],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return DecoderClient(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running card-game decoder.")
+    parser.add_argument("--socket", default=None, help="Serve on this Unix socket instead of stdin/stdout")
+    parser.add_argument("--cache_dir", default=policy_cache.DEFAULT_DIR, help="Directory of solved policies")
+    parser.add_argument("--no_cache", action="store_true", help="Keep solved policies in memory only")
+    args = parser.parse_args()
+
+    service = DecoderService(None if args.no_cache else args.cache_dir)
+    if args.socket:
+        serve_socket(service, args.socket)
+    else:
+        serve_stdio(service)
+
+if __name__ == "__main__":
+    main()
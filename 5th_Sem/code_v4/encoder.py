@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+
+import decoder
+
+# Writes the card-game MDP in the planner's text format. In-process callers
+# should use decoder.encode_mdp, which returns the same MDP as arrays.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode the card game as an MDP file for the planner.")
+    parser.add_argument("--game_config", required=True, help="Game config file")
+    args = parser.parse_args()
+
+    threshold, bonus, sequence = decoder.parse_game_config(args.game_config)
+    decoder.encode_mdp(threshold, bonus, sequence).write_text(sys.stdout)
+
+if __name__ == "__main__":
+    main()
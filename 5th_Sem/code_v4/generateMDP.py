@@ -1,7 +1,8 @@
 #! /usr/bin/python
-import random,argparse,sys
+import random,argparse,sys,io,contextlib
 parser = argparse.ArgumentParser()
 import numpy as np
+import mdp_arrays
 
 class MDP():
     def __init__(self,S,A,gamma,mdptype,rseed):
@@ -112,20 +113,105 @@ class MDP():
         print("mdptype",mdptype)
         print("discount ",gamma)
 
+def terminatingStates(S,A,s,a,s_next,end):
+    # Reverse-graph BFS from the end states: a state is good once every
+    # action has an edge into a good state (the same fixed point the
+    # episodic check in MDP computes, in one pass over the edges)
+    good = np.zeros(S,dtype=bool)
+    good[end] = True
+    covered = np.zeros(S*A,dtype=bool)
+    count = np.zeros(S,dtype=np.int64)
+    order = np.argsort(s_next)
+    ptr = np.searchsorted(s_next[order],np.arange(S+1))
+    frontier = np.asarray(end,dtype=np.int64)
+    while len(frontier):
+        lengths = ptr[frontier+1]-ptr[frontier]
+        edges = order[np.repeat(ptr[frontier],lengths)+np.arange(lengths.sum())-np.repeat(np.cumsum(lengths)-lengths,lengths)]
+        sa = s[edges].astype(np.int64)*A+a[edges]
+        sa = np.sort(sa[~covered[sa]])
+        sa = sa[np.append(True,sa[1:]!=sa[:-1])[:len(sa)]]
+        covered[sa] = True
+        states = sa//A
+        first = np.flatnonzero(np.append(True,states[1:]!=states[:-1])[:len(sa)])
+        states = states[first]
+        count[states] += np.diff(np.append(first,len(sa)))
+        frontier = states[(count[states]==A) & ~good[states]]
+        good[frontier] = True
+    return good
+
+def generateLargeMDP(S,A,gamma,mdptype,rseed,max_degree=5):
+    # Vectorized counterpart of MDP for large S: same structure and
+    # distributions, drawn with a numpy Generator, returned as an ArrayMDP
+    rng = np.random.default_rng(rseed)
+    top = min(max_degree,S)
+    if mdptype=="continuing":
+        end = np.zeros(0,dtype=np.int64)
+        live = np.arange(S)
+    else:
+        end = rng.choice(S,rng.integers(0,(max(2,S//10) if S>5 else min(2,S-2))+1),replace=False)
+        path = rng.permutation(np.setdiff1d(np.arange(S),end))
+        end = np.append(end,path[-1])
+        live = path[:-1]
+        # Instead of one long path, every live state gets its guaranteed edge
+        # to an end state or a live state before it in a random order: a
+        # random recursive tree, so episodes (and the BFS) are O(log S) deep
+        anchor = np.concatenate((end,live))
+        next_in_path = np.empty(S,dtype=np.int64)
+        next_in_path[live] = anchor[(rng.random(len(live))*(len(end)+np.arange(len(live)))).astype(np.int64)]
+        live = np.sort(live)
+    pair_s = np.repeat(live,A)
+    pair_a = np.tile(np.arange(A),len(live))
+    degree = rng.integers(1,top+1,size=len(pair_s))
+    if mdptype=="episodic":
+        degree -= 1
+    pair = np.repeat(np.arange(len(pair_s)),degree)
+    target = rng.integers(0,S,size=len(pair))
+    if mdptype=="episodic":
+        # Random edges avoid the tree edge, which is added separately
+        target = np.where(target==next_in_path[pair_s[pair]],(target+1+rng.integers(0,S-1,size=len(pair)))%S,target)
+    # Duplicate targets of one pair are merged, as sampling without replacement would
+    keep = np.unique(pair.astype(np.int64)*S+target,return_index=True)[1]
+    pair,target = pair[keep],target[keep]
+    if mdptype=="episodic":
+        weight = rng.integers(1,1001,size=len(pair)).astype(float)
+        total = np.bincount(pair,weights=weight,minlength=len(pair_s)).astype(np.int64)
+        path_weight = np.where(total>0,rng.integers(total//5,total+1),1).astype(float)
+        # pair is sorted, so the tree edge of pair p goes right after its
+        # random edges, shifted by the p tree edges placed before it
+        place = np.empty(len(pair)+len(pair_s),dtype=np.int64)
+        place[:len(pair)] = np.arange(len(pair))+pair
+        place[len(pair):] = np.searchsorted(pair,np.arange(len(pair_s)),side="right")+np.arange(len(pair_s))
+        order = np.empty_like(place)
+        order[place] = np.arange(len(place))
+        pair = np.concatenate((pair,np.arange(len(pair_s))))[order]
+        target = np.concatenate((target,next_in_path[pair_s]))[order]
+        weight = np.concatenate((weight,path_weight))[order]
+    else:
+        weight = rng.random(size=len(pair))
+    prob = weight/np.bincount(pair,weights=weight,minlength=len(pair_s))[pair]
+    reward = rng.uniform(-1,1,size=len(pair))
+    mdp = mdp_arrays.ArrayMDP(S,A,pair_s[pair],pair_a[pair],target,reward,prob,end,mdptype,gamma)
+    if mdptype=="episodic":
+        assert terminatingStates(S,A,mdp.s,mdp.a,mdp.s_next,end).all()
+    return mdp
+
 if __name__ == "__main__":
     parser.add_argument("--S",type=int,default=5)
     parser.add_argument("--A",type=int,default=2)
     parser.add_argument("--gamma",type=float,default=0.9)
     parser.add_argument("--mdptype",type=str,default="continuing")
     parser.add_argument("--rseed",type=int,default=0)
+    parser.add_argument("--binary",type=str,default=None,help="write the MDP to this file in binary format instead of printing it")
+    parser.add_argument("--large",action="store_true",help="vectorized generator without the size limit (different random stream)")
+    parser.add_argument("--max_degree",type=int,default=5,help="largest out-degree of a state-action pair with --large")
     
     
     args = parser.parse_args()
-    if not (args.S>1 and args.S<=100):
+    if not (args.S>1 and (args.large or args.S<=100)):
         print("number of states shoud be from 2 to 100")
         sys.exit(0)
     
-    if not (args.A>1 and args.A<=100):
+    if not (args.A>1 and (args.large or args.A<=100)):
         print("number of actions shoud be from 2 to 100")
         sys.exit(0)
     
@@ -138,7 +224,20 @@ if __name__ == "__main__":
     
     
     #print(args)
-    algo = MDP(args.S,args.A,args.gamma,args.mdptype,args.rseed)
+    if args.large:
+        mdp = generateLargeMDP(args.S,args.A,args.gamma,args.mdptype,args.rseed,args.max_degree)
+        if args.binary:
+            mdp_arrays.save_binary(mdp,args.binary)
+        else:
+            mdp.write_text(sys.stdout)
+    elif args.binary:
+        text = io.StringIO()
+        with contextlib.redirect_stdout(text):
+            algo = MDP(args.S,args.A,args.gamma,args.mdptype,args.rseed)
+        text.seek(0)
+        mdp_arrays.save_binary(mdp_arrays.parse_text(text),args.binary)
+    else:
+        algo = MDP(args.S,args.A,args.gamma,args.mdptype,args.rseed)
 
 
 
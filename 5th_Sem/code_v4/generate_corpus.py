@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import generateMDP
+import mdp_arrays
+from batch_solve import parse_range
+
+# A corpus is a directory of generated MDPs plus manifest.json, which maps
+# each file name to the parameters that produced it, its size and sha256.
+# Every instance is generated from its own seed in its own task, exactly as
+# one generateMDP.py run with the same arguments would, so files can be
+# regenerated one at a time and compared byte for byte.
+MANIFEST = "manifest.json"
+
+
+def instance_name(S, A, gamma, mdptype, seed, large, binary):
+    stem = f"{mdptype}-mdp-{S}-{A}-g{gamma:g}-s{seed}" + ("-large" if large else "")
+    return stem + (".mdpb" if binary else ".txt")
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def generate(out_dir, instance):
+    """Write one instance the way generateMDP.py would; returns its manifest entry."""
+    S, A, gamma, mdptype, seed, large, binary = (instance[k] for k in
+                                                 ("S", "A", "gamma", "mdptype", "seed", "large", "binary"))
+    name = instance_name(S, A, gamma, mdptype, seed, large, binary)
+    path = os.path.join(out_dir, name)
+    tmp = path + ".tmp"
+    if large:
+        mdp = generateMDP.generateLargeMDP(S, A, gamma, mdptype, seed)
+    else:
+        text = io.StringIO()
+        with contextlib.redirect_stdout(text):
+            generateMDP.MDP(S, A, gamma, mdptype, seed)
+        text.seek(0)
+    if binary:
+        mdp_arrays.save_binary(mdp if large else mdp_arrays.parse_text(text), tmp)
+    else:
+        with open(tmp, "w") as f:
+            if large:
+                mdp.write_text(f)
+            else:
+                f.write(text.getvalue())
+    os.replace(tmp, path)
+    return name, dict(instance, bytes=os.path.getsize(path), sha256=sha256(path))
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(dict(sorted(manifest.items())), f, indent=1)
+    os.replace(path + ".tmp", path)
+
+def check(out_dir, manifest):
+    """Names of manifest entries whose file is missing or has a different checksum."""
+    bad = []
+    for name, entry in sorted(manifest.items()):
+        path = os.path.join(out_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) != entry["bytes"] or sha256(path) != entry["sha256"]:
+            bad.append(name)
+    return bad
+
+def build(out_dir, instances, workers=None, force=False):
+    """Generate the instances not already in the corpus; yields (name, entry) as each finishes."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    todo = []
+    for instance in instances:
+        name = instance_name(*(instance[k] for k in ("S", "A", "gamma", "mdptype", "seed", "large", "binary")))
+        path = os.path.join(out_dir, name)
+        entry = manifest.get(name)
+        if force or entry is None or not os.path.exists(path) or os.path.getsize(path) != entry["bytes"]:
+            todo.append(instance)
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(generate, out_dir, instance) for instance in todo]
+            for future in as_completed(futures):
+                name, entry = future.result()
+                manifest[name] = entry
+                yield name, entry
+    finally:
+        save_manifest(out_dir, manifest)
+
+def grid(sizes, actions, gammas, mdptypes, seeds, large=False, binary=False):
+    return [{"S": S, "A": A, "gamma": gamma, "mdptype": mdptype, "seed": seed, "large": large, "binary": binary}
+            for S, A, gamma, mdptype, seed in itertools.product(sizes, actions, gammas, mdptypes, seeds)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a corpus of benchmark MDPs in parallel.")
+    parser.add_argument("out_dir", help="Corpus directory (holds manifest.json)")
+    parser.add_argument("--S", type=int, nargs="+", default=[10], help="Numbers of states")
+    parser.add_argument("--A", type=int, nargs="+", default=[5], help="Numbers of actions")
+    parser.add_argument("--gamma", type=float, nargs="+", default=[0.9])
+    parser.add_argument("--mdptype", nargs="+", choices=["continuing", "episodic"], default=["continuing", "episodic"])
+    parser.add_argument("--seeds", default="0:5", help="Seed range, e.g. 0:10 or 3")
+    parser.add_argument("--large", action="store_true", help="Use the vectorized generator (no size limit)")
+    parser.add_argument("--binary", action="store_true", help="Write the binary MDP format")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="Regenerate instances already in the manifest")
+    parser.add_argument("--check", action="store_true", help="Only verify the files against the manifest")
+    args = parser.parse_args()
+
+    if args.check:
+        bad = check(args.out_dir, load_manifest(args.out_dir))
+        for name in bad:
+            print(f"mismatch: {name}")
+        sys.exit(1 if bad else 0)
+    if not args.large and (max(args.S) > 100 or max(args.A) > 100):
+        parser.error("the classic generator allows at most 100 states and actions; use --large")
+
+    instances = grid(args.S, args.A, args.gamma, args.mdptype, parse_range(args.seeds), args.large, args.binary)
+    for name, entry in build(args.out_dir, instances, args.workers, args.force):
+        print(f"{name} {entry['bytes']} {entry['sha256'][:16]}", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import json
+
+import numpy as np
+
+# The planner's text format is
+#   numStates S / numActions A / end e1 e2 ... (or -1)
+#   transition s a s' r p   (one line each)
+#   mdptype episodic|continuing / discount g
+# ArrayMDP holds the same information as columnar arrays so it can be
+# handed between the encoder, planner and decoder without that round trip.
+#
+# The binary format is MAGIC, a little-endian uint32 header length, a JSON
+# header with the scalars and the offset of each array, then the arrays
+# (int32 indices, float64 rewards and probabilities) on 64-byte boundaries,
+# so load_binary can memory-map every column without copying.
+#
+# parse_text never builds a Python object per line: the few header lines are
+# found with str.find and cut out, the transition keywords blanked, and the
+# rest handed to np.fromstring as one whitespace-separated run of numbers.
+HEADER_KEYS = ("numStates", "numActions", "end", "mdptype", "discount")
+MAGIC = b"MDPB\x01\x00\x00\x00"
+ALIGN = 64
+COLUMNS = {"s": "<i4", "a": "<i4", "s_next": "<i4", "r": "<f8", "p": "<f8", "end": "<i4"}
+
+
+class ArrayMDP:
+    """A finite MDP as columnar transition arrays.
+
+    Transition k goes from state s[k] under action a[k] to s_next[k] with
+    reward r[k] and probability p[k]; end lists the terminal states.
+    """
+
+    def __init__(self, num_states, num_actions, s, a, s_next, r, p, end=(), mdptype="episodic", discount=1.0):
+        self.num_states = int(num_states)
+        self.num_actions = int(num_actions)
+        self.s = np.asarray(s, dtype=np.int32)
+        self.a = np.asarray(a, dtype=np.int32)
+        self.s_next = np.asarray(s_next, dtype=np.int32)
+        self.r = np.asarray(r, dtype=np.float64)
+        self.p = np.asarray(p, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.int32)
+        self.mdptype = mdptype
+        self.discount = float(discount)
+
+    def __len__(self):
+        return len(self.s)
+
+    def to_csr(self, tol=1e-6):
+        """CSRMDP of this MDP; raises ValueError unless every (s, a) with transitions sums to 1."""
+        S, A = self.num_states, self.num_actions
+        for name, column, bound in (("state", self.s, S), ("action", self.a, A), ("next state", self.s_next, S)):
+            if len(column) and (column.min() < 0 or column.max() >= bound):
+                raise ValueError(f"{name} out of range in transitions")
+        key = self.s.astype(np.int64) * A + self.a
+        order = None if np.all(key[1:] >= key[:-1]) else np.argsort(key, kind="stable")
+        pick = (lambda x: x) if order is None else (lambda x: x[order])
+        counts = np.bincount(key, minlength=S * A)
+        indptr = np.zeros(S * A + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        total = np.bincount(key, weights=self.p, minlength=S * A)
+        bad = np.flatnonzero((counts > 0) & (np.abs(total - 1) > tol))
+        if len(bad):
+            s, a = divmod(int(bad[0]), A)
+            raise ValueError(f"probabilities of state {s} action {a} sum to {float(total[bad[0]])!r}"
+                             + (f" ({len(bad) - 1} more pairs)" if len(bad) > 1 else ""))
+        return CSRMDP(S, A, indptr, pick(self.s_next), pick(self.r), pick(self.p), self.end, self.mdptype, self.discount)
+
+    def write_text(self, out, block=1 << 16):
+        """Write the MDP in the planner's text format, a block of transitions at a time."""
+        out.write(f"numStates {self.num_states}\n")
+        out.write(f"numActions {self.num_actions}\n")
+        out.write("end " + (" ".join(map(str, self.end.tolist())) if len(self.end) else "-1") + "\n")
+        for lo in range(0, len(self), block):
+            hi = lo + block
+            columns = (self.s[lo:hi].tolist(), self.a[lo:hi].tolist(), self.s_next[lo:hi].tolist(),
+                       self.r[lo:hi].tolist(), self.p[lo:hi].tolist())
+            out.write("".join(f"transition {s} {a} {t} {r!r} {p!r}\n" for s, a, t, r, p in zip(*columns)))
+        out.write(f"mdptype {self.mdptype}\n")
+        out.write(f"discount {self.discount!r}\n")
+
+
+class CSRMDP:
+    """A finite MDP with its transitions grouped by (state, action).
+
+    The transitions of state s under action a are entries
+    indptr[s * num_actions + a] to indptr[s * num_actions + a + 1] of s_next,
+    r and p; a pair without transitions has an empty row.
+    """
+
+    def __init__(self, num_states, num_actions, indptr, s_next, r, p, end=(), mdptype="episodic", discount=1.0):
+        self.num_states = int(num_states)
+        self.num_actions = int(num_actions)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.s_next = np.asarray(s_next, dtype=np.int32)
+        self.r = np.asarray(r, dtype=np.float64)
+        self.p = np.asarray(p, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.int32)
+        self.mdptype = mdptype
+        self.discount = float(discount)
+
+    def __len__(self):
+        return len(self.s_next)
+
+    def row_pairs(self):
+        """(s * num_actions + a) of every transition, in storage order."""
+        return np.repeat(np.arange(self.num_states * self.num_actions), np.diff(self.indptr))
+
+
+def parse_text(text):
+    """ArrayMDP of a file in the planner's text format, given as a string or an open file."""
+    if not isinstance(text, str):
+        text = text.read() if hasattr(text, "read") else "".join(text)
+    header, spans = {}, []
+    for key in HEADER_KEYS:
+        start = 0 if text.startswith(key) else text.find("\n" + key) + 1
+        if start or text.startswith(key):
+            stop = text.find("\n", start)
+            stop = len(text) if stop < 0 else stop
+            header[key] = text[start + len(key):stop].split()
+            spans.append((start, stop))
+    for key in ("numStates", "numActions", "mdptype", "discount"):
+        if not header.get(key):
+            raise ValueError(f"missing {key} line")
+    body, last = [], 0
+    for start, stop in sorted(spans):
+        body.append(text[last:start])
+        last = stop
+    body.append(text[last:])
+    count = text.count("transition")
+    fields = np.fromstring("".join(body).replace("transition", " "), dtype=np.float64, sep=" ") \
+        if count else np.zeros(0)
+    if fields.size != 5 * count:
+        raise ValueError(f"expected 5 numbers on each of {count} transition lines, found {fields.size} in all")
+    fields = fields.reshape(-1, 5)
+    end = [e for e in map(int, header.get("end", [])) if e >= 0]
+    return ArrayMDP(int(header["numStates"][0]), int(header["numActions"][0]), fields[:, 0], fields[:, 1],
+                    fields[:, 2], fields[:, 3], fields[:, 4], end, header["mdptype"][0], float(header["discount"][0]))
+
+def read_text(path):
+    with open(path) as f:
+        return parse_text(f)
+
+def read_columns(path, columns):
+    """(rows, columns) float array of a whitespace-separated table such as a planner output."""
+    with open(path) as f:
+        fields = np.fromstring(f.read(), dtype=np.float64, sep=" ")
+    if fields.size % columns:
+        raise ValueError(f"{path}: {fields.size} numbers do not make rows of {columns}")
+    return fields.reshape(-1, columns)
+
+def read_policy(path):
+    """Actions of a policy file, one per state."""
+    return read_columns(path, 1)[:, 0].astype(np.int32)
+
+def save_binary(mdp, path):
+    header = {"num_states": mdp.num_states, "num_actions": mdp.num_actions, "mdptype": mdp.mdptype,
+              "discount": mdp.discount, "arrays": {}}
+    offset = 0
+    for name, dtype in COLUMNS.items():
+        header["arrays"][name] = [offset, len(getattr(mdp, name))]
+        offset += -(-len(getattr(mdp, name)) * np.dtype(dtype).itemsize // ALIGN) * ALIGN
+    blob = json.dumps(header).encode()
+    start = -(-(len(MAGIC) + 4 + len(blob)) // ALIGN) * ALIGN
+    with open(path, "wb") as f:
+        f.write(MAGIC + np.uint32(len(blob)).astype("<u4").tobytes() + blob)
+        for name, dtype in COLUMNS.items():
+            f.seek(start + header["arrays"][name][0])
+            f.write(np.ascontiguousarray(getattr(mdp, name), dtype=dtype).tobytes())
+        f.truncate(start + offset)
+
+def is_binary(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def load_binary(path):
+    """ArrayMDP whose columns are read-only memory maps of a save_binary file."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a binary MDP file")
+        size = int(np.frombuffer(f.read(4), "<u4")[0])
+        header = json.loads(f.read(size))
+    start = -(-(len(MAGIC) + 4 + size) // ALIGN) * ALIGN
+    columns = {}
+    for name, dtype in COLUMNS.items():
+        offset, length = header["arrays"][name]
+        columns[name] = (np.memmap(path, dtype=dtype, mode="r", offset=start + offset, shape=(length,))
+                         if length else np.zeros(0, dtype=dtype))
+    mdp = object.__new__(ArrayMDP)
+    mdp.__dict__.update(columns, num_states=header["num_states"], num_actions=header["num_actions"],
+                        mdptype=header["mdptype"], discount=header["discount"])
+    return mdp
+
+def load(path):
+    """ArrayMDP of a text or binary MDP file."""
+    return load_binary(path) if is_binary(path) else read_text(path)
+
+def load_csr(path, tol=1e-6):
+    """CSRMDP of a text or binary MDP file, with its probabilities checked."""
+    return load(path).to_csr(tol)
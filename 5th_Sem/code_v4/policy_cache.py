@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Solved card-game configurations live in one directory per configuration,
+# named by a hash of (threshold, bonus, sequence, solver, version), holding
+# one .npy file per array so a lookup only has to memory-map them.
+DEFAULT_DIR = ".policy_cache"
+DEFAULT_MAX_BYTES = 512 * 2**20
+
+
+def cache_key(threshold, bonus, sequence, solver, version):
+    blob = json.dumps([threshold, bonus, list(sequence), solver, version])
+    return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+def entry_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def load(cache_dir, key):
+    """Memory-mapped arrays of a cached solution, or None on a miss."""
+    path = os.path.join(cache_dir, key)
+    if not os.path.isdir(path):
+        return None
+    try:
+        arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode="r")
+                  for name in os.listdir(path) if name.endswith(".npy")}
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return arrays or None
+
+def store(cache_dir, key, arrays, max_bytes=DEFAULT_MAX_BYTES):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=cache_dir)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, name + ".npy"), np.asarray(arr))
+    try:
+        os.rename(tmp, os.path.join(cache_dir, key))
+    except OSError:
+        # Another process stored the same configuration first.
+        shutil.rmtree(tmp, ignore_errors=True)
+    evict(cache_dir, max_bytes)
+
+def evict(cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """Drop least recently used entries until the cache fits in max_bytes."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(".") or not os.path.isdir(path):
+            continue
+        try:
+            entries.append((os.path.getmtime(path), entry_size(path), path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def clear(cache_dir):
+    shutil.rmtree(cache_dir, ignore_errors=True)